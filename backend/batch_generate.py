@@ -0,0 +1,23 @@
+"""Generates missing day content for courses through the Batch API.
+
+Run from the repository root, e.g. nightly for courses created during the day:
+
+    python -m backend.batch_generate                 # every course with missing days
+    python -m backend.batch_generate <course_id> ...  # only these courses
+"""
+import asyncio
+import json
+import sys
+from backend.main import generate_materials_batch, Database
+
+
+async def run(course_ids):
+    try:
+        await asyncio.to_thread(Database.migrate)
+        return await generate_materials_batch(course_ids or None)
+    finally:
+        await Database.dispose()
+
+
+if __name__ == "__main__":
+    print(json.dumps(asyncio.run(run(sys.argv[1:])), indent=2))
@@ -0,0 +1,345 @@
+"""Load and latency benchmark for the backend endpoints.
+
+Drives a mix of /new, /generate-day-content, /tutor and /get-schedule traffic against the FastAPI app
+in-process, with the offline completion backend standing in for OpenAI, and reports latency percentiles,
+throughput and event loop lag per endpoint. Run from the repository root:
+
+    python -m backend.benchmarks.load --duration 30 --concurrency 50 --output results.json
+    python -m backend.benchmarks.load --db-url postgresql://localhost/cogito_bench --baseline results.json
+
+With --baseline the run is compared against an earlier results file and exits with status 1 when any
+endpoint's p95/p99 latency grows, or its throughput drops, by more than --threshold.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional
+
+TOPICS = ["Linear Algebra", "Organic Chemistry", "Cell Biology", "Quantum Mechanics", "Data Structures"]
+ENDPOINTS = ["/new", "/generate-day-content", "/tutor", "/get-schedule"]
+MAX_COURSES_PER_USER = 3
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--db-url", help = "database to benchmark against, defaults to a fresh SQLite file")
+    parser.add_argument("--duration", type = float, default = 30.0, help = "seconds of measured traffic")
+    parser.add_argument("--concurrency", type = int, default = 50, help = "number of simulated users")
+    parser.add_argument("--mix", default = "new=1,generate-day-content=3,tutor=4,get-schedule=2",
+                        help = "relative weights per endpoint")
+    parser.add_argument("--think-time", type = float, default = 0.05, help = "mean pause between a user's requests")
+    parser.add_argument("--latency-mean", type = float, default = 1.0, help = "offline completion latency mean")
+    parser.add_argument("--latency-stddev", type = float, default = 0.5, help = "offline completion latency stddev")
+    parser.add_argument("--failure-rate", type = float, default = 0.0, help = "offline completion failure rate")
+    parser.add_argument("--short-response-rate", type = float, default = 0.0,
+                        help = "offline completion short response rate")
+    parser.add_argument("--requests-per-minute", type = int, default = 1000000,
+                        help = "completion rate limit, set it to the real quota to include throttling in the results")
+    parser.add_argument("--tokens-per-minute", type = int, default = 1000000000,
+                        help = "completion token rate limit")
+    parser.add_argument("--day-content-mode", choices = ("separate", "combined"), default = "separate",
+                        help = "generate a day's flashcards and quiz in two calls or one")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--output", help = "write the results as JSON to this file")
+    parser.add_argument("--baseline", help = "results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type = float, default = 0.10,
+                        help = "allowed relative regression before the comparison fails")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args: argparse.Namespace) -> str:
+    """Points the app at the benchmark database and the offline backend, must run before importing it."""
+    db_url = args.db_url
+    if not db_url:
+        db_path = os.path.join(tempfile.gettempdir(), "cogito-benchmark.db")
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        db_url = f"sqlite:///{db_path}"
+
+    os.environ["DB_URL"] = db_url
+    os.environ["COMPLETION_BACKEND"] = "offline"
+    # Every request should reach the backend, otherwise repeated topics only measure the cache
+    os.environ["COMPLETION_CACHE_ENABLED"] = "false"
+    os.environ["OFFLINE_LATENCY_MEAN_SECONDS"] = str(args.latency_mean)
+    os.environ["OFFLINE_LATENCY_STDDEV_SECONDS"] = str(args.latency_stddev)
+    os.environ["OFFLINE_FAILURE_RATE"] = str(args.failure_rate)
+    os.environ["OFFLINE_SHORT_RESPONSE_RATE"] = str(args.short_response_rate)
+    os.environ["OFFLINE_SEED"] = str(args.seed)
+    os.environ["REQUESTS_PER_MINUTE"] = str(args.requests_per_minute)
+    os.environ["TOKENS_PER_MINUTE"] = str(args.tokens_per_minute)
+    os.environ["DAY_CONTENT_MODE"] = args.day_content_mode
+    os.environ.setdefault("JWT_SECRET", "benchmark")
+
+    if db_url.startswith("sqlite"):
+        # The models use Postgres JSONB, which SQLite stores as plain JSON
+        from sqlalchemy.dialects.postgresql import JSONB
+        from sqlalchemy.ext.compiler import compiles
+
+        @compiles(JSONB, "sqlite")
+        def compile_jsonb_sqlite(type_, compiler, **kwargs):
+            return "JSON"
+
+    return db_url
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, weight = part.split("=")
+        endpoint = "/" + name.strip().lstrip("/")
+        if endpoint not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in --mix: {name}")
+        weights[endpoint] = float(weight)
+    return weights
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest rank
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    return {
+        "p50": percentile(values, 0.50) * 1000,
+        "p95": percentile(values, 0.95) * 1000,
+        "p99": percentile(values, 0.99) * 1000,
+        "max": (values[-1] if values else 0.0) * 1000
+    }
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output = True, text = True,
+                              check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class LoadRun:
+    def __init__(self, main, args: argparse.Namespace):
+        self.main = main
+        self.args = args
+        self.weights = parse_mix(args.mix)
+        self.random = random.Random(args.seed)
+        self.latencies: Dict[str, List[float]] = {endpoint: [] for endpoint in ENDPOINTS}
+        self.errors: Dict[str, Dict[str, int]] = {endpoint: {} for endpoint in ENDPOINTS}
+        self.loop_lag: List[float] = []
+        self.measuring = False
+        self.running = True
+        self.seeded = 0
+
+    async def create_user(self) -> Dict:
+        user_id = f"benchmark-{uuid.uuid4()}"
+        async with self.main.Database.session() as db:
+            db.add(self.main.Users(id = user_id, email = f"{user_id}@example.com"))
+            await db.commit()
+        token = self.main.TokenManager.create_access_token(user_id)
+        return {"id": user_id, "headers": {"Authorization": f"Bearer {token}"}, "courses": []}
+
+    async def request(self, client, endpoint: str, user: Dict) -> None:
+        if endpoint == "/new":
+            if len(user["courses"]) >= MAX_COURSES_PER_USER:
+                # Start over as a new user instead of measuring the course limit error
+                user.update(await self.create_user())
+            call = client.post("/new", headers = user["headers"],
+                               json = {"topic": self.random.choice(TOPICS), "description": "A one week overview"})
+        elif endpoint == "/generate-day-content":
+            call = client.post("/generate-day-content", headers = user["headers"],
+                               json = {"course_id": self.random.choice(user["courses"]),
+                                       "day_number": self.random.randint(1, 7)})
+        elif endpoint == "/get-schedule":
+            call = client.post("/get-schedule", headers = user["headers"],
+                               json = {"course_id": self.random.choice(user["courses"])})
+        else:
+            call = client.get("/tutor", headers = user["headers"])
+
+        start = time.perf_counter()
+        try:
+            response = await call
+            outcome = None if response.status_code < 400 else str(response.status_code)
+        except Exception as e:
+            response = None
+            outcome = type(e).__name__
+        elapsed = time.perf_counter() - start
+
+        if endpoint == "/new" and response is not None and response.status_code == 200:
+            user["courses"].append(response.json()["course"]["id"])
+
+        if self.measuring:
+            self.latencies[endpoint].append(elapsed)
+            if outcome:
+                self.errors[endpoint][outcome] = self.errors[endpoint].get(outcome, 0) + 1
+
+    async def simulated_user(self, client) -> None:
+        user = await self.create_user()
+        # Every user starts with one course, created before measuring starts
+        await self.request(client, "/new", user)
+        self.seeded += 1
+
+        endpoints = list(self.weights)
+        weights = [self.weights[endpoint] for endpoint in endpoints]
+        while self.running:
+            endpoint = self.random.choices(endpoints, weights)[0]
+            if endpoint != "/new" and not user["courses"]:
+                endpoint = "/new"
+            await self.request(client, endpoint, user)
+            await asyncio.sleep(self.random.expovariate(1 / self.args.think_time) if self.args.think_time > 0 else 0)
+
+    async def monitor_loop_lag(self, interval: float = 0.01) -> None:
+        while self.running:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            if self.measuring:
+                self.loop_lag.append(max(0.0, time.perf_counter() - start - interval))
+
+    async def run(self) -> Dict:
+        import httpx
+
+        app = self.main.create_app()
+        async with self.main.lifespan(app):
+            transport = httpx.ASGITransport(app = app)
+            async with httpx.AsyncClient(transport = transport, base_url = "http://benchmark", timeout = None) as client:
+                monitor = asyncio.create_task(self.monitor_loop_lag())
+                users = [asyncio.create_task(self.simulated_user(client)) for _ in range(self.args.concurrency)]
+
+                # Warm up until every simulated user has its first course
+                while self.seeded < len(users) and not all(task.done() for task in users):
+                    await asyncio.sleep(0.05)
+
+                metrics = self.main.Config.COMPLETION_METRICS
+                completions_before = metrics.totals()
+                self.measuring = True
+                started = time.perf_counter()
+                await asyncio.sleep(self.args.duration)
+                self.measuring = False
+                elapsed = time.perf_counter() - started
+                # Only completions made while measuring, including background generation they triggered
+                completions = {key: value - completions_before[key] for key, value in metrics.totals().items()}
+
+                # Let in-flight requests finish, they are no longer measured
+                self.running = False
+                await asyncio.wait(users, timeout = 30)
+                for task in users + [monitor]:
+                    task.cancel()
+                await asyncio.gather(*users, monitor, return_exceptions = True)
+
+        return self.results(elapsed, completions)
+
+    def results(self, elapsed: float, completions: Dict[str, float]) -> Dict:
+        endpoints = {}
+        for endpoint, latencies in self.latencies.items():
+            if not latencies:
+                continue
+            errors = sum(self.errors[endpoint].values())
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "errors": errors,
+                "error_breakdown": self.errors[endpoint],
+                "throughput_rps": len(latencies) / elapsed,
+                "latency_ms": summarize(latencies)
+            }
+
+        return {
+            "commit": current_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "config": {
+                "database": self.main.Database.engine().dialect.name,
+                "duration": elapsed,
+                "concurrency": self.args.concurrency,
+                "mix": self.weights,
+                "think_time": self.args.think_time,
+                "latency_mean": self.args.latency_mean,
+                "latency_stddev": self.args.latency_stddev,
+                "failure_rate": self.args.failure_rate,
+                "short_response_rate": self.args.short_response_rate,
+                "requests_per_minute": self.args.requests_per_minute,
+                "tokens_per_minute": self.args.tokens_per_minute,
+                "day_content_mode": self.args.day_content_mode,
+                "seed": self.args.seed
+            },
+            "total_throughput_rps": sum(len(latencies) for latencies in self.latencies.values()) / elapsed,
+            "endpoints": endpoints,
+            "completions": completions,
+            "event_loop_lag_ms": summarize(self.loop_lag)
+        }
+
+
+def print_results(results: Dict) -> None:
+    print(f"{'endpoint':<24}{'requests':>10}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, stats in results["endpoints"].items():
+        latency = stats["latency_ms"]
+        print(f"{endpoint:<24}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput_rps']:>9.1f}"
+              f"{latency['p50']:>10.1f}{latency['p95']:>10.1f}{latency['p99']:>10.1f}")
+    lag = results["event_loop_lag_ms"]
+    print(f"total throughput {results['total_throughput_rps']:.1f} rps, "
+          f"event loop lag p50 {lag['p50']:.1f} ms / p99 {lag['p99']:.1f} ms / max {lag['max']:.1f} ms")
+    completions = results.get("completions")
+    if completions:
+        print(f"{completions['calls']:.0f} completion calls, {completions['prompt_tokens']:.0f} prompt tokens "
+              f"({completions['cached_prompt_tokens']:.0f} cached), {completions['completion_tokens']:.0f} completion "
+              f"tokens, estimated cost ${completions['cost']:.4f}")
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Returns a description of every metric that regressed by more than threshold."""
+    regressions = []
+    for endpoint, stats in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if not previous:
+            continue
+
+        for metric in ("p95", "p99"):
+            before, after = previous["latency_ms"][metric], stats["latency_ms"][metric]
+            if before > 0 and after > before * (1 + threshold):
+                regressions.append(f"{endpoint} {metric} {before:.1f} ms -> {after:.1f} ms")
+
+        before, after = previous["throughput_rps"], stats["throughput_rps"]
+        if before > 0 and after < before * (1 - threshold):
+            regressions.append(f"{endpoint} throughput {before:.1f} rps -> {after:.1f} rps")
+
+    before, after = baseline.get("event_loop_lag_ms", {}).get("p99", 0), results["event_loop_lag_ms"]["p99"]
+    if before > 0 and after > before * (1 + threshold):
+        regressions.append(f"event loop lag p99 {before:.1f} ms -> {after:.1f} ms")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    configure_environment(args)
+
+    from backend import main as app_main
+
+    results = asyncio.run(LoadRun(app_main, args).run())
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent = 2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions against {args.baseline} (threshold {args.threshold:.0%}):")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"No regressions against {args.baseline} (threshold {args.threshold:.0%})")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
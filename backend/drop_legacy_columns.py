@@ -0,0 +1,21 @@
+"""Drops the legacy courses.day_N_flashcards/day_N_quiz columns.
+
+Startup only copies their content into course_day_content, so rolling back a deploy loses nothing.
+Run this from the repository root once the new table is confirmed:
+
+    python -m backend.drop_legacy_columns
+"""
+import json
+from backend.main import drop_legacy_day_content_columns, Database
+
+
+def run():
+    try:
+        Database.migrate()
+        return {"dropped": drop_legacy_day_content_columns()}
+    finally:
+        Database.engine().dispose()
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,227 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+from openai import AsyncOpenAI
+from pydantic import ValidationError
+from .utils.config import Config
+from .utils.offline_client import OfflineBackend
+from .model_prompts.prompts import SystemPrompts
+from .formats.json_formats import ResponseFormats
+from .formats.schema_registry import SchemaRegistry
+from .completions import Completions
+
+class BatchBackend(ABC):
+    """The parts of the Batch API that BatchGenerator needs, so a local stand-in can replace OpenAI."""
+
+    @abstractmethod
+    async def upload(self, requests_jsonl: str) -> str:
+        ...
+
+    @abstractmethod
+    async def create(self, input_file_id: str) -> str:
+        ...
+
+    @abstractmethod
+    async def retrieve(self, batch_id: str) -> Dict:
+        """Returns {"status", "output_file_id", "error_file_id"} using the Batch API's status names."""
+
+    @abstractmethod
+    async def download(self, file_id: str) -> str:
+        ...
+
+
+class OpenAIBatchBackend(BatchBackend):
+    def __init__(self, client: AsyncOpenAI):
+        self.client = client
+
+    async def upload(self, requests_jsonl: str) -> str:
+        uploaded = await self.client.files.create(file = ("requests.jsonl", requests_jsonl.encode()), purpose = "batch")
+        return uploaded.id
+
+    async def create(self, input_file_id: str) -> str:
+        batch = await self.client.batches.create(input_file_id = input_file_id,
+                                                 endpoint = "/v1/chat/completions",
+                                                 completion_window = "24h")
+        return batch.id
+
+    async def retrieve(self, batch_id: str) -> Dict:
+        batch = await self.client.batches.retrieve(batch_id)
+        return {"status": batch.status, "output_file_id": batch.output_file_id, "error_file_id": batch.error_file_id}
+
+    async def download(self, file_id: str) -> str:
+        content = await self.client.files.content(file_id)
+        return content.text
+
+
+class LocalBatchBackend(BatchBackend):
+    """Keeps batches as files in a directory and answers them from the offline fixtures when first polled."""
+
+    def __init__(self, directory: str, offline_backend: OfflineBackend):
+        self.directory = directory
+        self.offline_backend = offline_backend
+        os.makedirs(directory, exist_ok = True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    async def upload(self, requests_jsonl: str) -> str:
+        file_id = f"file-{uuid.uuid4().hex}"
+        await asyncio.to_thread(self._write, f"{file_id}.jsonl", requests_jsonl)
+        return file_id
+
+    async def create(self, input_file_id: str) -> str:
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        batch = {"status": "validating", "input_file_id": input_file_id, "output_file_id": None, "error_file_id": None}
+        await asyncio.to_thread(self._write, f"{batch_id}.json", json.dumps(batch))
+        return batch_id
+
+    async def retrieve(self, batch_id: str) -> Dict:
+        return await asyncio.to_thread(self._process, batch_id)
+
+    async def download(self, file_id: str) -> str:
+        return await asyncio.to_thread(self._read, f"{file_id}.jsonl")
+
+    def _write(self, name: str, content: str):
+        with open(self._path(name), "w") as f:
+            f.write(content)
+
+    def _read(self, name: str) -> str:
+        with open(self._path(name)) as f:
+            return f.read()
+
+    def _process(self, batch_id: str) -> Dict:
+        batch = json.loads(self._read(f"{batch_id}.json"))
+        if batch["status"] == "completed":
+            return batch
+
+        outputs, errors = [], []
+        for line in self._read(f"{batch['input_file_id']}.jsonl").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            body = request["body"]
+            _, failure, completion = self.offline_backend.respond(body["messages"], body["response_format"])
+
+            if failure is not None:
+                errors.append({"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"],
+                               "response": {"status_code": 500, "body": {"error": {"message": str(failure)}}},
+                               "error": None})
+            else:
+                outputs.append({"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"],
+                                "response": {"status_code": 200, "body": completion.model_dump(mode = "json")},
+                                "error": None})
+
+        for key, lines in (("output_file_id", outputs), ("error_file_id", errors)):
+            if lines:
+                file_id = f"file-{uuid.uuid4().hex}"
+                self._write(f"{file_id}.jsonl", "".join(json.dumps(line) + "\n" for line in lines))
+                batch[key] = file_id
+
+        batch["status"] = "completed"
+        self._write(f"{batch_id}.json", json.dumps(batch))
+        return batch
+
+
+class BatchGenerator:
+    """Generates day content for many courses through the Batch API instead of live completions."""
+
+    # Batches in any of these states will not produce (more) output
+    FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+    def __init__(self, backend: BatchBackend):
+        self.backend = backend
+
+    @staticmethod
+    def from_config() -> "BatchGenerator":
+        if Config.BATCH_BACKEND == "local":
+            return BatchGenerator(LocalBatchBackend(Config.BATCH_LOCAL_DIR, Config.OFFLINE_BACKEND))
+        return BatchGenerator(OpenAIBatchBackend(AsyncOpenAI(api_key = Config.OPENAI_API_KEY)))
+
+    @staticmethod
+    def _request(custom_id: str, system_prompt: str, user_prompt: str, response_format: ResponseFormats) -> Dict:
+        return {"custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {"model": Config.MODEL_NAME,
+                         "messages": [{"role": "system", "content": system_prompt},
+                                      {"role": "user", "content": user_prompt}],
+                         "response_format": SchemaRegistry.response_format(response_format)}}
+
+    @staticmethod
+    def day_requests(course_id: str, schedule: Dict, day_numbers: List[int], difficulty: int = 2) -> List[Dict]:
+        """Flashcards and a quiz for each day's subtopic, the same content generate_day_content produces live."""
+        requests = []
+        for day_number in day_numbers:
+            subtopic = schedule[f"day_{day_number}"]["subtopic"]
+            requests.append(BatchGenerator._request(f"{course_id}|{day_number}|flashcards",
+                                                    SystemPrompts.flashcard_system_prompt,
+                                                    Completions.count_prompt(Completions.flashcard_user_prompt(subtopic),
+                                                                             "flashcard_pairs", Config.NUM_FLASHCARDS),
+                                                    ResponseFormats.FlashCardResponseFormat))
+            requests.append(BatchGenerator._request(f"{course_id}|{day_number}|quiz",
+                                                    SystemPrompts.quiz_system_prompt,
+                                                    Completions.count_prompt(Completions.quiz_user_prompt(subtopic, difficulty),
+                                                                             "quiz_questions", Config.NUM_QUIZ_QUESTIONS),
+                                                    ResponseFormats.QuizResponseFormat))
+        return requests
+
+    async def submit(self, requests: List[Dict]) -> str:
+        input_file_id = await self.backend.upload("".join(json.dumps(request) + "\n" for request in requests))
+        return await self.backend.create(input_file_id)
+
+    async def wait(self, batch_id: str, poll_interval: float, timeout: Optional[float] = None) -> Dict:
+        started = time.monotonic()
+        while True:
+            batch = await self.backend.retrieve(batch_id)
+            if batch["status"] in self.FINAL_STATUSES:
+                return batch
+            if timeout is not None and time.monotonic() - started >= timeout:
+                raise TimeoutError(f"Batch {batch_id} still {batch['status']} after {timeout} seconds")
+            await asyncio.sleep(poll_interval)
+
+    async def results(self, batch: Dict) -> Tuple[Dict[Tuple[str, int], Dict[str, Dict]], List[str]]:
+        """Returns the valid content keyed on (course_id, day_number) and the custom_ids that failed or came back short."""
+        kinds = {"flashcards": (ResponseFormats.FlashCardResponseFormat, "flashcard_pairs", Config.NUM_FLASHCARDS),
+                 "quiz": (ResponseFormats.QuizResponseFormat, "quiz_questions", Config.NUM_QUIZ_QUESTIONS)}
+        contents: Dict[Tuple[str, int], Dict[str, Dict]] = {}
+        failed = []
+
+        if batch.get("error_file_id"):
+            for line in (await self.backend.download(batch["error_file_id"])).splitlines():
+                if line.strip():
+                    failed.append(json.loads(line)["custom_id"])
+
+        if not batch.get("output_file_id"):
+            return contents, failed
+
+        for line in (await self.backend.download(batch["output_file_id"])).splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            custom_id = result["custom_id"]
+            course_id, day_number, kind = custom_id.split("|")
+            response_format, iter_name, num_iter = kinds[kind]
+
+            try:
+                if result.get("error") or result["response"]["status_code"] != 200:
+                    raise ValueError(result.get("error") or result["response"]["status_code"])
+                content = result["response"]["body"]["choices"][0]["message"]["content"]
+                event = SchemaRegistry.parse(response_format, content)
+            except (ValueError, ValidationError, KeyError, IndexError) as e:
+                print(f"Error in batch result {custom_id}: {e}")
+                failed.append(custom_id)
+                continue
+
+            # Short responses are left for the live path, which can top them up
+            if len(event[iter_name]) < num_iter:
+                failed.append(custom_id)
+                continue
+
+            event[iter_name] = event[iter_name][:num_iter]
+            contents.setdefault((course_id, int(day_number)), {})[kind] = event
+
+        return contents, failed
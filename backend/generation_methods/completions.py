@@ -1,86 +1,631 @@
 import json
-from typing import Dict
+import time
+import asyncio
+from typing import Dict, List, Tuple, AsyncIterator, Optional
+from jiter import from_json
+from openai import APITimeoutError
+from pydantic import BaseModel, ValidationError
 from .utils.config import Config
+from .utils.rate_limiter import RateLimiter
+from .utils.completion_cache import CompletionCache
 from .model_prompts.prompts import SystemPrompts
-from .formats.json_formats import ResponseFormats
+from .formats.json_formats import ResponseFormats, ItemFormats
+from .formats.schema_registry import SchemaRegistry
 from .formats.enums import QuizDifficulty
 
 class CompletionFormat:
+    # Built from Config on first use, so importing this module reads no settings
+    _cache: Optional[CompletionCache] = None
+    _semaphore: Optional[asyncio.Semaphore] = None
+    _rate_limiter: Optional[RateLimiter] = None
+
+    @staticmethod
+    def _completion_cache() -> CompletionCache:
+        if CompletionFormat._cache is None:
+            CompletionFormat._cache = CompletionCache(max_entries = Config.COMPLETION_CACHE_SIZE,
+                                                      ttl_seconds = Config.COMPLETION_CACHE_TTL_SECONDS,
+                                                      db_url = Config.COMPLETION_CACHE_DB_URL)
+        return CompletionFormat._cache
+
+    @staticmethod
+    def _concurrency() -> asyncio.Semaphore:
+        if CompletionFormat._semaphore is None:
+            CompletionFormat._semaphore = asyncio.Semaphore(Config.MAX_CONCURRENT_COMPLETIONS)
+        return CompletionFormat._semaphore
+
+    @staticmethod
+    def _limiter() -> RateLimiter:
+        if CompletionFormat._rate_limiter is None:
+            CompletionFormat._rate_limiter = RateLimiter(Config.REQUESTS_PER_MINUTE, Config.TOKENS_PER_MINUTE)
+        return CompletionFormat._rate_limiter
+
+    @staticmethod
+    def cache_stats() -> Dict:
+        return CompletionFormat._completion_cache().stats()
+
+    @staticmethod
+    async def evict_expired_cache():
+        """Evicts expired completion cache entries every COMPLETION_CACHE_EVICTION_INTERVAL_SECONDS until cancelled."""
+        await CompletionFormat._completion_cache().evict_periodically(Config.COMPLETION_CACHE_EVICTION_INTERVAL_SECONDS)
+
+    @staticmethod
+    def _cacheable(event: Dict) -> bool:
+        # Short lists are retried or topped up, a cached one would be served again for the whole TTL
+        if not event:
+            return False
+        required = {"flashcard_pairs": Config.NUM_FLASHCARDS, "quiz_questions": Config.NUM_QUIZ_QUESTIONS}
+        return all(len(event[name]) >= count for name, count in required.items() if name in event)
+
+    @staticmethod
+    def _messages(system_prompt: str, user_prompt: str) -> List[Dict]:
+        # The static system prompt goes first so it and the schema stay a cacheable prefix
+        return [{"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}]
+
+    @staticmethod
+    def _parse(completion, response_format: ResponseFormats) -> Dict:
+        message = completion.choices[0].message
+        if message.content is None:
+            raise ValueError(f"No content in completion: {message.refusal}")
+        return SchemaRegistry.parse(response_format, message.content)
+
+    @staticmethod
+    def _record_completion(seconds: float, completion, model: str, outcome: str = "success"):
+        usage = completion.usage
+        details = usage.prompt_tokens_details if usage else None
+        Config.COMPLETION_METRICS.record_call(model, outcome,
+                                              seconds = seconds,
+                                              prompt_tokens = usage.prompt_tokens if usage else 0,
+                                              completion_tokens = usage.completion_tokens if usage else 0,
+                                              cached_prompt_tokens = (details.cached_tokens or 0) if details else 0)
+
+    @staticmethod
+    def _record_failure(error: Exception, response_format: ResponseFormats, model: str,
+                        seconds: Optional[float] = None, completion = None):
+        """Records the failed call once. seconds is None when it failed before reaching the API."""
+        invalid = isinstance(error, (ValidationError, json.JSONDecodeError))
+        if invalid:
+            Config.COMPLETION_METRICS.record_validation_failure(response_format.__name__)
+        timed_out = isinstance(error, (asyncio.TimeoutError, APITimeoutError))
+        outcome = "invalid" if invalid else "timeout" if timed_out else "error"
+        if completion is not None:
+            # A response came back and its tokens were paid for, it just could not be used
+            CompletionFormat._record_completion(seconds, completion, model, outcome)
+        else:
+            Config.COMPLETION_METRICS.record_call(model, outcome, seconds = seconds)
+        if Config.HEDGE_POLICY.record_failure(model):
+            print(f"Falling back to {Config.HEDGE_POLICY.fallback_model} after repeated failures of {model}")
+            Config.COMPLETION_METRICS.record_fallback(Config.HEDGE_POLICY.fallback_model)
+
+    @staticmethod
+    async def _attempt(system_prompt: str, user_prompt: str, response_format: ResponseFormats, model: str,
+                       acquired: Optional[asyncio.Event] = None) -> Dict:
+        """One completion call with the policy's deadline, parsed so an invalid result does not win a hedge.
+
+        acquired is set once the rate limiter lets the call through.
+        """
+        estimated_tokens = (len(system_prompt) + len(user_prompt)) // 4 + Config.COMPLETION_TOKEN_ESTIMATE
+        rate_entry = await CompletionFormat._limiter().acquire(estimated_tokens)
+        if acquired is not None:
+            acquired.set()
+
+        started = time.perf_counter()
+        completion = None
+        try:
+            completion = await asyncio.wait_for(
+                Config.async_openai_client().chat.completions.create(
+                    model = model,
+                    messages = CompletionFormat._messages(system_prompt, user_prompt),
+                    response_format = SchemaRegistry.response_format(response_format)),
+                Config.HEDGE_POLICY.deadline_seconds)
+            seconds = time.perf_counter() - started
+            Config.HEDGE_POLICY.record_latency(model, seconds)
+
+            if completion.usage:
+                CompletionFormat._limiter().reconcile(rate_entry, completion.usage.total_tokens)
+
+            event = CompletionFormat._parse(completion, response_format)
+        except asyncio.TimeoutError as e:
+            error = asyncio.TimeoutError(f"No completion from {model} within {Config.HEDGE_POLICY.deadline_seconds} seconds")
+            print(f"Error in _attempt: {error}")
+            CompletionFormat._record_failure(error, response_format, model, time.perf_counter() - started)
+            raise error from e
+        except asyncio.CancelledError:
+            # Lost to another attempt, so its latency is only known to be at least this long
+            Config.HEDGE_POLICY.record_latency(model, time.perf_counter() - started)
+            raise
+        except Exception as e:
+            print(f"Error in _attempt: {e}")
+            CompletionFormat._record_failure(e, response_format, model, time.perf_counter() - started, completion)
+            raise
+
+        CompletionFormat._record_completion(seconds, completion, model)
+        Config.HEDGE_POLICY.record_success(model)
+        return event
+
+    @staticmethod
+    async def _hedged_completion(system_prompt: str, user_prompt: str, response_format: ResponseFormats,
+                                 model: str) -> Dict:
+        """The first valid result of the call and of any duplicates fired while it is slower than usual."""
+        policy = Config.HEDGE_POLICY
+        hedge_delay = policy.hedge_delay(model)
+
+        acquired = asyncio.Event()
+        attempts = [asyncio.create_task(
+            CompletionFormat._attempt(system_prompt, user_prompt, response_format, model, acquired))]
+        pending = set(attempts)
+        # The hedge clock runs from when the latest attempt got past the rate limiter
+        acquired_at = None
+        acquiring = None
+        error = None
+        try:
+            while pending:
+                timeout = None
+                waiters = set(pending)
+                if hedge_delay is not None and len(attempts) <= policy.max_hedges:
+                    if acquired_at is None:
+                        # Hedging an attempt still queued on the limiter would only queue another one behind it
+                        acquiring = acquiring or asyncio.create_task(acquired.wait())
+                        waiters.add(acquiring)
+                    else:
+                        timeout = max(0.0, acquired_at + hedge_delay - time.monotonic())
+
+                done, _ = await asyncio.wait(waiters, timeout = timeout, return_when = asyncio.FIRST_COMPLETED)
+                if acquiring in done:
+                    done.discard(acquiring)
+                    acquiring = None
+                    acquired_at = time.monotonic()
+                    if not done:
+                        continue
+
+                if not done:
+                    Config.COMPLETION_METRICS.record_hedge(model)
+                    acquired = asyncio.Event()
+                    acquired_at = None
+                    hedge = asyncio.create_task(
+                        CompletionFormat._attempt(system_prompt, user_prompt, response_format, model, acquired))
+                    attempts.append(hedge)
+                    pending.add(hedge)
+                    continue
+
+                pending -= done
+                for attempt in done:
+                    if attempt.exception() is None:
+                        Config.COMPLETION_METRICS.record_attempt_win(model, "primary" if attempt is attempts[0] else "hedge")
+                        return attempt.result()
+                    error = attempt.exception()
+            raise error
+        finally:
+            for attempt in pending:
+                attempt.cancel()
+            if acquiring is not None:
+                acquiring.cancel()
+
     @staticmethod
     def return_completion(topic: str, system_prompt: str, user_prompt: str, response_format: ResponseFormats) -> Dict:
+        model = Config.HEDGE_POLICY.model()
+        started = None
+        completion = None
         try:
-            completion = Config.OPENAI_CLIENT.beta.chat.completions.parse(
-                model = Config.MODEL_NAME,
-                messages = [{"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_prompt}],
-                response_format = response_format)
-            
-            event = completion.choices[0].message.content
-            event = json.loads(event)
-            
+            if Config.COMPLETION_CACHE_ENABLED:
+                cache_key = CompletionFormat._completion_cache().key(system_prompt, user_prompt, model, response_format)
+                cached = CompletionFormat._completion_cache().get(cache_key)
+                if cached is not None:
+                    Config.COMPLETION_METRICS.record_call(model, "cached")
+                    return cached
+
+            started = time.perf_counter()
+            completion = Config.openai_client().chat.completions.create(
+                model = model,
+                messages = CompletionFormat._messages(system_prompt, user_prompt),
+                response_format = SchemaRegistry.response_format(response_format),
+                timeout = Config.HEDGE_POLICY.deadline_seconds)
+            seconds = time.perf_counter() - started
+
+            event = CompletionFormat._parse(completion, response_format)
+            CompletionFormat._record_completion(seconds, completion, model)
+            Config.HEDGE_POLICY.record_success(model)
+
+            if Config.COMPLETION_CACHE_ENABLED and CompletionFormat._cacheable(event):
+                CompletionFormat._completion_cache().set(cache_key, event)
+
             return event
         except Exception as e:
             print(f"Error in return_completion: {e}")
+            CompletionFormat._record_failure(e, response_format, model,
+                                             time.perf_counter() - started if started is not None else None, completion)
             return {}
 
+    @staticmethod
+    async def return_completion_async(topic: str, system_prompt: str, user_prompt: str, response_format: ResponseFormats) -> Dict:
+        # Picked once so the result is cached under the model that actually answered
+        model = Config.HEDGE_POLICY.model()
+        try:
+            if Config.COMPLETION_CACHE_ENABLED:
+                cache_key = CompletionFormat._completion_cache().key(system_prompt, user_prompt, model, response_format)
+                cached = await CompletionFormat._completion_cache().get_async(cache_key)
+                if cached is not None:
+                    Config.COMPLETION_METRICS.record_call(model, "cached")
+                    return cached
+
+            # Hedges share the caller's slot, they only exist while an attempt is slower than usual
+            async with CompletionFormat._concurrency():
+                event = await CompletionFormat._hedged_completion(system_prompt, user_prompt, response_format, model)
+
+            if Config.COMPLETION_CACHE_ENABLED and CompletionFormat._cacheable(event):
+                await CompletionFormat._completion_cache().set_async(cache_key, event)
+
+            return event
+        except Exception as e:
+            # Failed attempts are recorded as they happen
+            print(f"Error in return_completion_async: {e}")
+            return {}
+
+    @staticmethod
+    async def stream_completion_items(topic: str, system_prompt: str, user_prompt: str, response_format: ResponseFormats,
+                                      iter_name: str, item_format: BaseModel) -> AsyncIterator[Tuple[str, Dict]]:
+        """Yields ("item", item) for each completed entry of the iter_name list as it streams in, then ("done", event)."""
+        model = Config.HEDGE_POLICY.model()
+        started = None
+        completion = None
+        emitted = 0
+        event = {}
+        partial = {}
+        streamed_items = []
+
+        def completed_items(items: List, final: bool) -> List[Dict]:
+            # While streaming the last entry may still be partial, so it is only released at the end
+            ready = items if final else items[:-1]
+            valid = []
+            for item in ready:
+                try:
+                    valid.append(item_format.model_validate(item).model_dump(mode = "json"))
+                except ValidationError:
+                    if final:
+                        Config.COMPLETION_METRICS.record_validation_failure(item_format.__name__)
+                    break
+            return valid
+
+        try:
+            if Config.COMPLETION_CACHE_ENABLED:
+                cache_key = CompletionFormat._completion_cache().key(system_prompt, user_prompt, model, response_format)
+                cached = await CompletionFormat._completion_cache().get_async(cache_key)
+                if cached is not None:
+                    Config.COMPLETION_METRICS.record_call(model, "cached")
+                    for item in cached.get(iter_name, []):
+                        yield "item", item
+                    yield "done", cached
+                    return
+
+            async with CompletionFormat._concurrency():
+                estimated_tokens = (len(system_prompt) + len(user_prompt)) // 4 + Config.COMPLETION_TOKEN_ESTIMATE
+                rate_entry = await CompletionFormat._limiter().acquire(estimated_tokens)
+
+                started = time.perf_counter()
+                # Streams are not hedged, the deadline bounds the wait for each chunk instead of the whole call
+                async with Config.async_openai_client().beta.chat.completions.stream(
+                    model = model,
+                    messages = CompletionFormat._messages(system_prompt, user_prompt),
+                    response_format = SchemaRegistry.response_format(response_format),
+                    stream_options = {"include_usage": True},
+                    timeout = Config.HEDGE_POLICY.deadline_seconds) as stream:
+
+                    async for stream_event in stream:
+                        if stream_event.type != "content.delta":
+                            continue
+
+                        # The SDK only partially parses for class response formats, not precompiled ones
+                        snapshot = from_json(stream_event.snapshot.encode(), partial_mode = True)
+                        if not isinstance(snapshot, dict):
+                            continue
+
+                        partial = snapshot
+                        items = completed_items(partial.get(iter_name) or [], final = False)
+                        for item in items[emitted:]:
+                            streamed_items.append(item)
+                            yield "item", item
+                        emitted = max(emitted, len(items))
+
+                    completion = await stream.get_final_completion()
+                seconds = time.perf_counter() - started
+
+                if completion.usage:
+                    CompletionFormat._limiter().reconcile(rate_entry, completion.usage.total_tokens)
+
+            event = CompletionFormat._parse(completion, response_format)
+            CompletionFormat._record_completion(seconds, completion, model)
+            Config.HEDGE_POLICY.record_success(model)
+            items = completed_items(event.get(iter_name, []), final = True)
+            for item in items[emitted:]:
+                yield "item", item
+            event[iter_name] = items
+
+            if Config.COMPLETION_CACHE_ENABLED and CompletionFormat._cacheable(event):
+                await CompletionFormat._completion_cache().set_async(cache_key, event)
+        except Exception as e:
+            print(f"Error in stream_completion_items: {e}")
+            CompletionFormat._record_failure(e, response_format, model,
+                                             time.perf_counter() - started if started is not None else None, completion)
+            # Salvage what was already streamed so callers can top it up instead of starting over
+            event = {**partial, iter_name: streamed_items} if streamed_items else {}
+
+        yield "done", event
+
 class Completions:
+    @staticmethod
+    def count_prompt(user_prompt: str, iter_name: str, count: int) -> str:
+        # The count is only in the user prompt, so the system prompt stays a cacheable prefix and top-ups can lower it
+        return f"{user_prompt} Generate exactly {count} {iter_name.replace('_', ' ')}."
+
+    @staticmethod
+    def _top_up_prompt(user_prompt: str, iter_name: str, items: List[Dict], missing: int) -> str:
+        covered = "; ".join(item.get("question", "") for item in items)
+        return (f"{Completions.count_prompt(user_prompt, iter_name, missing)} "
+                f"Do not repeat any of these questions, which are already covered: {covered}")
+
+    @staticmethod
+    def _merge_items(event: Dict, result: Dict, iter_name: str, top_up: bool) -> Dict:
+        if not result or iter_name not in result:
+            return event
+
+        new_items = result[iter_name]
+        if not event:
+            return result
+
+        if top_up:
+            seen = {item.get("question") for item in event[iter_name]}
+            event[iter_name].extend(item for item in new_items if item.get("question") not in seen)
+        elif len(new_items) > len(event.get(iter_name, [])):
+            # Without top-up each attempt starts over, so keep whichever response was longest
+            return result
+
+        return event
+
+    @staticmethod
+    def _finish_items(event: Dict, iter_name: str, num_iter: int, attempts: int) -> Dict:
+        if not event:
+            return {}
+
+        if len(event[iter_name]) < num_iter:
+            print(f"Returning {len(event[iter_name])}/{num_iter} {iter_name} after {attempts} attempts")
+            Config.COMPLETION_METRICS.record_short_response(iter_name)
+
+        event[iter_name] = event[iter_name][:num_iter]
+
+        return event
+
+    @staticmethod
+    def _return_items(topic: str, system_prompt: str, user_prompt: str, response_format: ResponseFormats,
+                      iter_name: str, num_iter: int) -> Dict:
+        policy = Config.RETRY_POLICY
+        event = {}
+
+        for attempt in range(1, policy.max_attempts + 1):
+            prompt = Completions.count_prompt(user_prompt, iter_name, num_iter)
+            if event and policy.top_up:
+                prompt = Completions._top_up_prompt(user_prompt, iter_name, event[iter_name],
+                                                    num_iter - len(event[iter_name]))
+
+            result = CompletionFormat.return_completion(topic = topic,
+                                                        system_prompt = system_prompt,
+                                                        user_prompt = prompt,
+                                                        response_format = response_format)
+            event = Completions._merge_items(event, result, iter_name, policy.top_up)
+
+            if event and len(event[iter_name]) >= num_iter:
+                break
+            if attempt < policy.max_attempts:
+                Config.COMPLETION_METRICS.record_retry(iter_name)
+                time.sleep(policy.backoff(attempt))
+
+        return Completions._finish_items(event, iter_name, num_iter, attempt)
+
+    @staticmethod
+    async def _return_items_async(topic: str, system_prompt: str, user_prompt: str, response_format: ResponseFormats,
+                                  iter_name: str, num_iter: int, event: Optional[Dict] = None) -> Dict:
+        policy = Config.RETRY_POLICY
+        # A seeded event (e.g. a short streamed response) is topped up rather than regenerated
+        event = event or {}
+
+        for attempt in range(1, policy.max_attempts + 1):
+            prompt = Completions.count_prompt(user_prompt, iter_name, num_iter)
+            if event and policy.top_up:
+                prompt = Completions._top_up_prompt(user_prompt, iter_name, event[iter_name],
+                                                    num_iter - len(event[iter_name]))
+
+            result = await CompletionFormat.return_completion_async(topic = topic,
+                                                                    system_prompt = system_prompt,
+                                                                    user_prompt = prompt,
+                                                                    response_format = response_format)
+            event = Completions._merge_items(event, result, iter_name, policy.top_up)
+
+            if event and len(event[iter_name]) >= num_iter:
+                break
+            if attempt < policy.max_attempts:
+                Config.COMPLETION_METRICS.record_retry(iter_name)
+                await asyncio.sleep(policy.backoff(attempt))
+
+        return Completions._finish_items(event, iter_name, num_iter, attempt)
+
     @staticmethod
     def return_flashcards(topic: str) -> Dict:
         try:
             system_prompt = SystemPrompts.flashcard_system_prompt
-            user_prompt = f"Please generate flashcards for the topic {topic}."
+            user_prompt = Completions.flashcard_user_prompt(topic)
             response_format = ResponseFormats.FlashCardResponseFormat
             iter_name = "flashcard_pairs"
             num_iter = Config.NUM_FLASHCARDS
 
-            event = CompletionFormat.return_completion(topic = topic, 
-                                                       system_prompt = system_prompt, 
-                                                       user_prompt = user_prompt, 
-                                                       response_format = response_format)
-
-            if not event or len(event.get(iter_name, [])) < num_iter:
-                event = Completions.return_flashcards(topic)
+            return Completions._return_items(topic = topic,
+                                             system_prompt = system_prompt,
+                                             user_prompt = user_prompt,
+                                             response_format = response_format,
+                                             iter_name = iter_name,
+                                             num_iter = num_iter)
+        except Exception as e:
+            print(f"Error in return_flashcards: {e}")
+            return {}
 
-            event[iter_name] = event[iter_name][:num_iter]
+    @staticmethod
+    async def return_flashcards_async(topic: str) -> Dict:
+        try:
+            system_prompt = SystemPrompts.flashcard_system_prompt
+            user_prompt = Completions.flashcard_user_prompt(topic)
+            response_format = ResponseFormats.FlashCardResponseFormat
+            iter_name = "flashcard_pairs"
+            num_iter = Config.NUM_FLASHCARDS
 
-            return event
+            return await Completions._return_items_async(topic = topic,
+                                                         system_prompt = system_prompt,
+                                                         user_prompt = user_prompt,
+                                                         response_format = response_format,
+                                                         iter_name = iter_name,
+                                                         num_iter = num_iter)
         except Exception as e:
-            print(f"Error in return_flashcards: {e}")
+            print(f"Error in return_flashcards_async: {e}")
             return {}
 
+    @staticmethod
+    def flashcard_user_prompt(topic: str) -> str:
+        return f"Please generate flashcards for the topic {topic}."
+
+    @staticmethod
+    def quiz_difficulty(difficulty: int) -> QuizDifficulty:
+        difficulty_mapping = {
+        1: QuizDifficulty.Easy,
+        2: QuizDifficulty.Medium,
+        3: QuizDifficulty.Hard
+        }
+
+        difficulty_enum = difficulty_mapping.get(difficulty)
+
+        if not difficulty_enum:
+            raise ValueError("Invalid difficulty level. Must be 1 (Easy), 2 (Medium), or 3 (Hard).")
+
+        return difficulty_enum
+
+    @staticmethod
+    def quiz_user_prompt(topic: str, difficulty: int) -> str:
+        difficulty_enum = Completions.quiz_difficulty(difficulty)
+        return f"Please generate quiz questions for the topic {topic} with a given difficulty of {difficulty_enum}."
+
+    @staticmethod
+    def day_content_user_prompt(topic: str, difficulty: int) -> str:
+        difficulty_enum = Completions.quiz_difficulty(difficulty)
+        return (f"Please generate {Config.NUM_FLASHCARDS} flashcards and {Config.NUM_QUIZ_QUESTIONS} quiz questions "
+                f"for the topic {topic} with a given quiz difficulty of {difficulty_enum}.")
+
     @staticmethod
     def return_quiz(topic: str, difficulty: int) -> Dict:
         try:
-            difficulty_mapping = {
-            1: QuizDifficulty.Easy,
-            2: QuizDifficulty.Medium,
-            3: QuizDifficulty.Hard
-            }
-
-            difficulty_enum = difficulty_mapping.get(difficulty)
+            system_prompt = SystemPrompts.quiz_system_prompt
+            user_prompt = Completions.quiz_user_prompt(topic, difficulty)
+            response_format = ResponseFormats.QuizResponseFormat
+            iter_name = "quiz_questions"
+            num_iter = Config.NUM_QUIZ_QUESTIONS
 
-            if not difficulty_enum:
-                raise ValueError("Invalid difficulty level. Must be 1 (Easy), 2 (Medium), or 3 (Hard).")
+            return Completions._return_items(topic = topic,
+                                             system_prompt = system_prompt,
+                                             user_prompt = user_prompt,
+                                             response_format = response_format,
+                                             iter_name = iter_name,
+                                             num_iter = num_iter)
+        except Exception as e:
+            print(f"Error in return_quiz: {e}")
+            return {}
 
+    @staticmethod
+    async def return_quiz_async(topic: str, difficulty: int) -> Dict:
+        try:
             system_prompt = SystemPrompts.quiz_system_prompt
-            user_prompt = f"Please generate quiz questions for the topic {topic} with a given difficulty of {difficulty_enum}."
+            user_prompt = Completions.quiz_user_prompt(topic, difficulty)
             response_format = ResponseFormats.QuizResponseFormat
             iter_name = "quiz_questions"
             num_iter = Config.NUM_QUIZ_QUESTIONS
 
-            event = CompletionFormat.return_completion(topic = topic, 
-                                                       system_prompt = system_prompt, 
-                                                       user_prompt = user_prompt, 
-                                                       response_format = response_format)
+            return await Completions._return_items_async(topic = topic,
+                                                         system_prompt = system_prompt,
+                                                         user_prompt = user_prompt,
+                                                         response_format = response_format,
+                                                         iter_name = iter_name,
+                                                         num_iter = num_iter)
+        except Exception as e:
+            print(f"Error in return_quiz_async: {e}")
+            return {}
 
-            if not event or len(event.get(iter_name, [])) < num_iter:
-                event = Completions.return_quiz(topic, difficulty)
+    @staticmethod
+    async def return_day_content_async(topic: str, difficulty: int) -> Dict:
+        try:
+            if Config.DAY_CONTENT_MODE == "combined":
+                return await Completions.return_day_content_combined_async(topic, difficulty)
 
-            event[iter_name] = event[iter_name][:num_iter]
+            flashcards, quiz = await asyncio.gather(Completions.return_flashcards_async(topic),
+                                                    Completions.return_quiz_async(topic, difficulty))
 
-            return event
+            return {"flashcards": flashcards,
+                    "quiz": quiz}
         except Exception as e:
-            print(f"Error in return_quiz: {e}")
+            print(f"Error in return_day_content_async: {e}")
+            return {}
+
+    @staticmethod
+    async def return_day_content_combined_async(topic: str, difficulty: int) -> Dict:
+        """Flashcards and quiz from one DayContentResponseFormat call, in the same shape as the two-call path."""
+        try:
+            system_prompt = SystemPrompts.day_content_system_prompt
+            user_prompt = Completions.day_content_user_prompt(topic, difficulty)
+            response_format = ResponseFormats.DayContentResponseFormat
+
+            event = await CompletionFormat.return_completion_async(topic = topic,
+                                                                   system_prompt = system_prompt,
+                                                                   user_prompt = user_prompt,
+                                                                   response_format = response_format)
+            if not event:
+                # Nothing usable came back, so fall back to the two separate calls
+                flashcards, quiz = await asyncio.gather(Completions.return_flashcards_async(topic),
+                                                        Completions.return_quiz_async(topic, difficulty))
+                return {"flashcards": flashcards,
+                        "quiz": quiz}
+
+            flashcards = {"topic": event["topic"], "flashcard_pairs": event["flashcard_pairs"]}
+            quiz = {"topic": event["topic"], "difficulty": event["difficulty"], "quiz_questions": event["quiz_questions"]}
+
+            # A short list is topped up through its own format's retry path, the other half is kept
+            jobs = []
+            if len(flashcards["flashcard_pairs"]) < Config.NUM_FLASHCARDS:
+                Config.COMPLETION_METRICS.record_retry("flashcard_pairs")
+                jobs.append(Completions._return_items_async(topic = topic,
+                                                            system_prompt = SystemPrompts.flashcard_system_prompt,
+                                                            user_prompt = Completions.flashcard_user_prompt(topic),
+                                                            response_format = ResponseFormats.FlashCardResponseFormat,
+                                                            iter_name = "flashcard_pairs",
+                                                            num_iter = Config.NUM_FLASHCARDS,
+                                                            event = flashcards))
+            else:
+                flashcards = Completions._finish_items(flashcards, "flashcard_pairs", Config.NUM_FLASHCARDS, 1)
+
+            if len(quiz["quiz_questions"]) < Config.NUM_QUIZ_QUESTIONS:
+                Config.COMPLETION_METRICS.record_retry("quiz_questions")
+                jobs.append(Completions._return_items_async(topic = topic,
+                                                            system_prompt = SystemPrompts.quiz_system_prompt,
+                                                            user_prompt = Completions.quiz_user_prompt(topic, difficulty),
+                                                            response_format = ResponseFormats.QuizResponseFormat,
+                                                            iter_name = "quiz_questions",
+                                                            num_iter = Config.NUM_QUIZ_QUESTIONS,
+                                                            event = quiz))
+            else:
+                quiz = Completions._finish_items(quiz, "quiz_questions", Config.NUM_QUIZ_QUESTIONS, 1)
+
+            for result in await asyncio.gather(*jobs):
+                if "flashcard_pairs" in result:
+                    flashcards = result
+                elif "quiz_questions" in result:
+                    quiz = result
+
+            return {"flashcards": flashcards,
+                    "quiz": quiz}
+        except Exception as e:
+            print(f"Error in return_day_content_combined_async: {e}")
             return {}
 
     @staticmethod
@@ -100,6 +645,23 @@ class Completions:
             print(f"Error in return_week_schedule: {e}")
             return {}
 
+    @staticmethod
+    async def return_week_schedule_async(topic: str, desc: str) -> Dict:
+        try:
+            system_prompt = SystemPrompts.schedule_system_prompt
+            user_prompt = f"Please generate a schedule for the overall subject {topic}. Here is a brief description of the syllabus and the user's strengths and weaknesses: {desc}"
+            response_format = ResponseFormats.ScheduleResponseFormat
+
+            basic_schedule = await CompletionFormat.return_completion_async(topic = topic,
+                                                                              system_prompt = system_prompt,
+                                                                              user_prompt = user_prompt,
+                                                                              response_format = response_format)
+
+            return basic_schedule
+        except Exception as e:
+            print(f"Error in return_week_schedule_async: {e}")
+            return {}
+
     @staticmethod
     def return_week_material(schedule: Dict) -> Dict:
         try:
@@ -134,3 +696,72 @@ class Completions:
         except Exception as e:
             print(f"Error in return_week_material: {e}")
             return {}
+
+    @staticmethod
+    async def _stream_items(topic: str, system_prompt: str, user_prompt: str, response_format: ResponseFormats,
+                            iter_name: str, num_iter: int, item_format: BaseModel) -> AsyncIterator[Tuple[str, Dict]]:
+        event = {}
+        emitted = 0
+
+        async for kind, value in CompletionFormat.stream_completion_items(topic = topic,
+                                                                          system_prompt = system_prompt,
+                                                                          user_prompt = Completions.count_prompt(user_prompt, iter_name, num_iter),
+                                                                          response_format = response_format,
+                                                                          iter_name = iter_name,
+                                                                          item_format = item_format):
+            if kind == "done":
+                event = value
+            elif emitted < num_iter:
+                emitted += 1
+                yield "item", value
+
+        if not event or len(event.get(iter_name, [])) < num_iter:
+            # Top up a short stream with the regular retry policy and stream the extra items
+            Config.COMPLETION_METRICS.record_retry(iter_name)
+            event = await Completions._return_items_async(topic = topic,
+                                                          system_prompt = system_prompt,
+                                                          user_prompt = user_prompt,
+                                                          response_format = response_format,
+                                                          iter_name = iter_name,
+                                                          num_iter = num_iter,
+                                                          event = event)
+            for item in event.get(iter_name, [])[emitted:]:
+                yield "item", item
+        else:
+            event = Completions._finish_items(event, iter_name, num_iter, 1)
+
+        yield "done", event
+
+    @staticmethod
+    async def stream_flashcards(topic: str) -> AsyncIterator[Tuple[str, Dict]]:
+        system_prompt = SystemPrompts.flashcard_system_prompt
+        user_prompt = Completions.flashcard_user_prompt(topic)
+        response_format = ResponseFormats.FlashCardResponseFormat
+        iter_name = "flashcard_pairs"
+        num_iter = Config.NUM_FLASHCARDS
+
+        async for kind, value in Completions._stream_items(topic = topic,
+                                                           system_prompt = system_prompt,
+                                                           user_prompt = user_prompt,
+                                                           response_format = response_format,
+                                                           iter_name = iter_name,
+                                                           num_iter = num_iter,
+                                                           item_format = ItemFormats.FlashCard):
+            yield kind, value
+
+    @staticmethod
+    async def stream_quiz(topic: str, difficulty: int) -> AsyncIterator[Tuple[str, Dict]]:
+        system_prompt = SystemPrompts.quiz_system_prompt
+        user_prompt = Completions.quiz_user_prompt(topic, difficulty)
+        response_format = ResponseFormats.QuizResponseFormat
+        iter_name = "quiz_questions"
+        num_iter = Config.NUM_QUIZ_QUESTIONS
+
+        async for kind, value in Completions._stream_items(topic = topic,
+                                                           system_prompt = system_prompt,
+                                                           user_prompt = user_prompt,
+                                                           response_format = response_format,
+                                                           iter_name = iter_name,
+                                                           num_iter = num_iter,
+                                                           item_format = ItemFormats.QuizQuestion):
+            yield kind, value
@@ -33,6 +33,12 @@ class ResponseFormats:
         difficulty: QuizDifficulty
         quiz_questions: List[ItemFormats.QuizQuestion]
 
+    class DayContentResponseFormat(BaseModel):
+        topic: str
+        flashcard_pairs: List[ItemFormats.FlashCard]
+        difficulty: QuizDifficulty
+        quiz_questions: List[ItemFormats.QuizQuestion]
+
     class ScheduleResponseFormat(BaseModel):
         topic: str
         day_1: ItemFormats.DaySchedule
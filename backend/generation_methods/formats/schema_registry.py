@@ -0,0 +1,122 @@
+import hashlib
+import json
+from typing import Dict
+from pydantic import BaseModel
+from .json_formats import ResponseFormats
+
+class SchemaRegistry:
+    """Strict JSON schema response formats, compiled once per ResponseFormats class instead of on every call.
+
+    Sending the same compiled dict every time also keeps the schema part of the prompt byte-identical,
+    which the provider's prompt caching relies on.
+    """
+
+    _compiled: Dict[type, Dict] = {}
+    _hashes: Dict[type, str] = {}
+    _by_name: Dict[str, type] = {}
+
+    @staticmethod
+    def _strict(schema: Dict, root: Dict) -> Dict:
+        """Applies the structured output rules to a pydantic JSON schema in place, as the SDK's parse helpers do.
+
+        Every object gets additionalProperties false and all of its properties required, None defaults are
+        dropped, single-entry allOf is merged and a $ref with sibling keys is inlined.
+        """
+        for defs_key in ("$defs", "definitions"):
+            for definition in (schema.get(defs_key) or {}).values():
+                SchemaRegistry._strict(definition, root)
+
+        if schema.get("type") == "object" and "additionalProperties" not in schema:
+            schema["additionalProperties"] = False
+
+        properties = schema.get("properties")
+        if isinstance(properties, dict):
+            schema["required"] = list(properties)
+            schema["properties"] = {key: SchemaRegistry._strict(value, root) for key, value in properties.items()}
+
+        if isinstance(schema.get("items"), dict):
+            schema["items"] = SchemaRegistry._strict(schema["items"], root)
+
+        if isinstance(schema.get("anyOf"), list):
+            schema["anyOf"] = [SchemaRegistry._strict(variant, root) for variant in schema["anyOf"]]
+
+        all_of = schema.get("allOf")
+        if isinstance(all_of, list):
+            if len(all_of) == 1:
+                schema.update(SchemaRegistry._strict(all_of[0], root))
+                schema.pop("allOf")
+            else:
+                schema["allOf"] = [SchemaRegistry._strict(entry, root) for entry in all_of]
+
+        if "default" in schema and schema["default"] is None:
+            schema.pop("default")
+
+        ref = schema.get("$ref")
+        if ref and len(schema) > 1:
+            if not ref.startswith("#/"):
+                raise ValueError(f"Unexpected $ref format {ref!r}")
+            resolved = root
+            for key in ref[2:].split("/"):
+                resolved = resolved[key]
+            # Keys next to the $ref win over the referenced schema's
+            schema.update({**resolved, **schema})
+            schema.pop("$ref")
+            return SchemaRegistry._strict(schema, root)
+
+        return schema
+
+    @staticmethod
+    def compile(response_format: type) -> Dict:
+        """The strict json_schema response_format for a pydantic model, built without the SDK's private helpers."""
+        if not (isinstance(response_format, type) and issubclass(response_format, BaseModel)):
+            raise TypeError(f"Response formats must be pydantic models, got {response_format!r}")
+
+        schema = response_format.model_json_schema()
+        return {"type": "json_schema",
+                "json_schema": {"schema": SchemaRegistry._strict(schema, schema),
+                                "name": response_format.__name__,
+                                "strict": True}}
+
+    @staticmethod
+    def register(response_format: type) -> Dict:
+        compiled = SchemaRegistry.compile(response_format)
+        schema = json.dumps(compiled, sort_keys = True)
+        SchemaRegistry._compiled[response_format] = compiled
+        SchemaRegistry._hashes[response_format] = hashlib.sha256(schema.encode()).hexdigest()
+        SchemaRegistry._by_name[compiled["json_schema"]["name"]] = response_format
+        return compiled
+
+    @staticmethod
+    def response_format(response_format: type) -> Dict:
+        compiled = SchemaRegistry._compiled.get(response_format)
+        if compiled is None:
+            compiled = SchemaRegistry.register(response_format)
+        return compiled
+
+    @staticmethod
+    def schema_hash(response_format: type) -> str:
+        if response_format not in SchemaRegistry._hashes:
+            SchemaRegistry.register(response_format)
+        return SchemaRegistry._hashes[response_format]
+
+    @staticmethod
+    def lookup(response_format) -> type:
+        """The ResponseFormats class for a class or a compiled response_format dict."""
+        if isinstance(response_format, dict):
+            SchemaRegistry.compile_all()
+            return SchemaRegistry._by_name[response_format["json_schema"]["name"]]
+        return response_format
+
+    @staticmethod
+    def parse(response_format: type, content: str) -> Dict:
+        # One validating parse straight from the JSON text, no separate json.loads pass
+        return response_format.model_validate_json(content).model_dump(mode = "json")
+
+    @staticmethod
+    def compile_all():
+        """Compiles every ResponseFormats class, called on app startup so no request pays for it."""
+        for response_format in (ResponseFormats.FlashCardResponseFormat,
+                                ResponseFormats.QuizResponseFormat,
+                                ResponseFormats.DayContentResponseFormat,
+                                ResponseFormats.ScheduleResponseFormat):
+            SchemaRegistry.response_format(response_format)
@@ -0,0 +1,150 @@
+import asyncio
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from sqlalchemy import create_engine, MetaData, Table, Column, String, Float, JSON, select, delete
+from sqlalchemy.engine import Engine
+from ..formats.schema_registry import SchemaRegistry
+
+class CompletionCache:
+    """Two tier cache of parsed completions: an in-process LRU in front of a persistent SQL table."""
+
+    _metadata = MetaData()
+    _table = Table(
+        "completion_cache",
+        _metadata,
+        Column("key", String(64), primary_key=True),
+        Column("value", JSON, nullable=False),
+        Column("expires_at", Float, nullable=False, index=True),
+    )
+
+    def __init__(self, max_entries: int, ttl_seconds: float, db_url: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_url = db_url
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._engine: Optional[Engine] = None
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def key(self, system_prompt: str, user_prompt: str, model: str, response_format: type) -> str:
+        schema_hash = SchemaRegistry.schema_hash(response_format)
+
+        digest = hashlib.sha256()
+        for part in (system_prompt, user_prompt, model, schema_hash):
+            digest.update(part.encode())
+            digest.update(b"\0")
+
+        return digest.hexdigest()
+
+    def _persistent_engine(self) -> Optional[Engine]:
+        if not self.db_url:
+            return None
+        if self._engine is None:
+            engine = create_engine(self.db_url, pool_pre_ping=True)
+            self._metadata.create_all(bind=engine, checkfirst=True)
+            self._engine = engine
+        return self._engine
+
+    def _remember(self, key: str, value: Dict, expires_at: float):
+        # Callers mutate returned completions, so the cache only ever hands out copies
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return copy.deepcopy(value)
+                del self._entries[key]
+
+        try:
+            engine = self._persistent_engine()
+            if engine is not None:
+                with engine.connect() as connection:
+                    row = connection.execute(
+                        select(self._table.c.value, self._table.c.expires_at)
+                        .where(self._table.c.key == key, self._table.c.expires_at > now)
+                    ).first()
+                if row is not None:
+                    self._remember(key, row.value, row.expires_at)
+                    self.persistent_hits += 1
+                    return row.value
+        except Exception as e:
+            print(f"Error reading completion cache: {e}")
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: Dict):
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, value, expires_at)
+
+        try:
+            engine = self._persistent_engine()
+            if engine is not None:
+                with engine.begin() as connection:
+                    connection.execute(delete(self._table).where(self._table.c.key == key))
+                    connection.execute(self._table.insert().values(key=key, value=value, expires_at=expires_at))
+        except Exception as e:
+            print(f"Error writing completion cache: {e}")
+
+    async def get_async(self, key: str) -> Optional[Dict]:
+        # The persistent tier uses a blocking driver, so keep it off the event loop
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return copy.deepcopy(entry[1])
+        return await asyncio.to_thread(self.get, key)
+
+    async def set_async(self, key: str, value: Dict):
+        await asyncio.to_thread(self.set, key, value)
+
+    def evict_expired(self) -> int:
+        """Drops expired entries from both tiers and returns how many persistent rows were removed."""
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]:
+                del self._entries[key]
+
+        engine = self._persistent_engine()
+        if engine is None:
+            return 0
+        with engine.begin() as connection:
+            removed = connection.execute(delete(self._table).where(self._table.c.expires_at <= now)).rowcount
+        self.evicted += removed
+        return removed
+
+    async def evict_periodically(self, interval_seconds: float):
+        """Runs evict_expired every interval_seconds until cancelled, expired rows are never read but stay otherwise."""
+        while True:
+            try:
+                await asyncio.to_thread(self.evict_expired)
+            except Exception as e:
+                print(f"Error evicting completion cache: {e}")
+            await asyncio.sleep(interval_seconds)
+
+    def stats(self) -> Dict:
+        return {"memory_hits": self.memory_hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "evicted": self.evicted}
@@ -1,12 +1,140 @@
-from openai import OpenAI
+from typing import Dict, Optional
 from dotenv import load_dotenv
+from openai import OpenAI, AsyncOpenAI
+from .retry_policy import RetryPolicy
+from .hedge_policy import HedgePolicy
+from .offline_client import OfflineBackend, OfflineOpenAI, OfflineAsyncOpenAI
+from .metrics import CompletionMetrics
 import os
+import tempfile
 
-load_dotenv()
+class LazySettings(type):
+        """Metaclass for settings classes that read .env and the environment the first time a setting is read.
 
-class Config:
-        OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY")
-        OPENAI_CLIENT: OpenAI = OpenAI(api_key = OPENAI_API_KEY)
+        The class lists its settings as annotations and returns their values from a settings() staticmethod, so
+        importing it reads nothing. Values assigned to the class before the first read are kept.
+        """
+        def __init__(cls, name, bases, namespace):
+                super().__init__(name, bases, namespace)
+                cls._loaded = False
+
+        def __getattr__(cls, name: str):
+                if name.startswith("_") or cls._loaded:
+                        raise AttributeError(f"type object {cls.__name__!r} has no attribute {name!r}")
+                cls.load()
+                return getattr(cls, name)
+
+        def load(cls):
+                if cls._loaded:
+                        return
+                cls._loaded = True
+                load_dotenv()
+                for name, value in cls.settings().items():
+                        if name not in cls.__dict__:
+                                setattr(cls, name, value)
+
+class Config(metaclass = LazySettings):
+        OPENAI_API_KEY: Optional[str]
+        # "openai" calls the API, "offline" serves the examples fixtures for load testing
+        COMPLETION_BACKEND: str
+        OFFLINE_BACKEND: OfflineBackend
+        # Created on first use by openai_client() / async_openai_client(), importing the config has no side effects
+        OPENAI_CLIENT: Optional[OpenAI] = None
+        ASYNC_OPENAI_CLIENT: Optional[AsyncOpenAI] = None
         MODEL_NAME: str = "gpt-4o-mini-2024-07-18"
+        # Used instead of MODEL_NAME for FALLBACK_COOLDOWN_SECONDS after FALLBACK_AFTER_FAILURES failures in a row
+        FALLBACK_MODEL_NAME: str
         NUM_FLASHCARDS: int = 20
-        NUM_QUIZ_QUESTIONS: int = 10
\ No newline at end of file
+        NUM_QUIZ_QUESTIONS: int = 10
+        # "separate" generates a day's flashcards and quiz in two calls, "combined" in one DayContentResponseFormat call
+        DAY_CONTENT_MODE: str
+        MAX_CONCURRENT_COMPLETIONS: int
+        REQUESTS_PER_MINUTE: int
+        TOKENS_PER_MINUTE: int
+        COMPLETION_TOKEN_ESTIMATE: int = 2000
+        RETRY_POLICY: RetryPolicy
+        # A duplicate request is fired once an attempt is slower than HEDGE_PERCENTILE of recent calls to its model
+        HEDGE_POLICY: HedgePolicy
+        COMPLETION_CACHE_ENABLED: bool
+        COMPLETION_CACHE_SIZE: int
+        COMPLETION_CACHE_TTL_SECONDS: int
+        COMPLETION_CACHE_DB_URL: Optional[str]
+        COMPLETION_CACHE_EVICTION_INTERVAL_SECONDS: int
+        # Prices in US dollars per million tokens, used for the cost estimates in /metrics
+        PROMPT_TOKEN_COST_PER_MILLION: float
+        CACHED_PROMPT_TOKEN_COST_PER_MILLION: float
+        COMPLETION_TOKEN_COST_PER_MILLION: float
+        COMPLETION_METRICS: CompletionMetrics
+        # Batch API generation, "local" answers batches from the offline fixtures through files in BATCH_LOCAL_DIR
+        BATCH_BACKEND: str
+        BATCH_LOCAL_DIR: str
+        BATCH_POLL_INTERVAL_SECONDS: float
+
+        @staticmethod
+        def settings() -> Dict:
+                completion_backend = (os.getenv("COMPLETION_BACKEND") or "openai").lower()
+                fallback_model_name = os.getenv("FALLBACK_MODEL_NAME") or "gpt-4o-2024-08-06"
+                prompt_cost = float(os.getenv("PROMPT_TOKEN_COST_PER_MILLION") or 0.15)
+                cached_prompt_cost = float(os.getenv("CACHED_PROMPT_TOKEN_COST_PER_MILLION") or 0.075)
+                completion_cost = float(os.getenv("COMPLETION_TOKEN_COST_PER_MILLION") or 0.60)
+
+                return {
+                        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY"),
+                        "COMPLETION_BACKEND": completion_backend,
+                        "OFFLINE_BACKEND": OfflineBackend(
+                                latency_distribution = os.getenv("OFFLINE_LATENCY_DISTRIBUTION") or "lognormal",
+                                latency_mean = float(os.getenv("OFFLINE_LATENCY_MEAN_SECONDS") or 2.0),
+                                latency_stddev = float(os.getenv("OFFLINE_LATENCY_STDDEV_SECONDS") or 1.0),
+                                failure_rate = float(os.getenv("OFFLINE_FAILURE_RATE") or 0.0),
+                                short_response_rate = float(os.getenv("OFFLINE_SHORT_RESPONSE_RATE") or 0.0),
+                                seed = int(os.getenv("OFFLINE_SEED")) if os.getenv("OFFLINE_SEED") else None),
+                        "FALLBACK_MODEL_NAME": fallback_model_name,
+                        "DAY_CONTENT_MODE": (os.getenv("DAY_CONTENT_MODE") or "separate").lower(),
+                        "MAX_CONCURRENT_COMPLETIONS": int(os.getenv("MAX_CONCURRENT_COMPLETIONS") or 8),
+                        "REQUESTS_PER_MINUTE": int(os.getenv("REQUESTS_PER_MINUTE") or 500),
+                        "TOKENS_PER_MINUTE": int(os.getenv("TOKENS_PER_MINUTE") or 200000),
+                        "RETRY_POLICY": RetryPolicy(max_attempts = int(os.getenv("MAX_GENERATION_ATTEMPTS") or 3)),
+                        "HEDGE_POLICY": HedgePolicy(
+                                primary_model = Config.MODEL_NAME,
+                                fallback_model = fallback_model_name,
+                                deadline_seconds = float(os.getenv("COMPLETION_DEADLINE_SECONDS") or 60),
+                                hedge_percentile = float(os.getenv("HEDGE_PERCENTILE") or 0.95),
+                                hedge_delay_seconds = float(os.getenv("HEDGE_DELAY_SECONDS") or 15),
+                                max_hedges = int(os.getenv("MAX_HEDGED_REQUESTS") or 1),
+                                fallback_after = int(os.getenv("FALLBACK_AFTER_FAILURES") or 3),
+                                fallback_cooldown_seconds = float(os.getenv("FALLBACK_COOLDOWN_SECONDS") or 300)),
+                        "COMPLETION_CACHE_ENABLED": (os.getenv("COMPLETION_CACHE_ENABLED") or "true").lower() == "true",
+                        "COMPLETION_CACHE_SIZE": int(os.getenv("COMPLETION_CACHE_SIZE") or 1024),
+                        "COMPLETION_CACHE_TTL_SECONDS": int(os.getenv("COMPLETION_CACHE_TTL_SECONDS") or 7 * 24 * 60 * 60),
+                        "COMPLETION_CACHE_DB_URL": os.getenv("COMPLETION_CACHE_DB_URL") or os.getenv("DB_URL"),
+                        "COMPLETION_CACHE_EVICTION_INTERVAL_SECONDS": int(os.getenv("COMPLETION_CACHE_EVICTION_INTERVAL_SECONDS") or 60 * 60),
+                        "PROMPT_TOKEN_COST_PER_MILLION": prompt_cost,
+                        "CACHED_PROMPT_TOKEN_COST_PER_MILLION": cached_prompt_cost,
+                        "COMPLETION_TOKEN_COST_PER_MILLION": completion_cost,
+                        "COMPLETION_METRICS": CompletionMetrics(
+                                prompt_cost_per_million = prompt_cost,
+                                completion_cost_per_million = completion_cost,
+                                max_courses = int(os.getenv("METRICS_MAX_COURSES") or 1000),
+                                cached_prompt_cost_per_million = cached_prompt_cost),
+                        "BATCH_BACKEND": (os.getenv("BATCH_BACKEND") or ("local" if completion_backend == "offline" else "openai")).lower(),
+                        "BATCH_LOCAL_DIR": os.getenv("BATCH_LOCAL_DIR") or os.path.join(tempfile.gettempdir(), "cogito-batches"),
+                        "BATCH_POLL_INTERVAL_SECONDS": float(os.getenv("BATCH_POLL_INTERVAL_SECONDS") or 60),
+                }
+
+        @staticmethod
+        def openai_client() -> OpenAI:
+                if Config.OPENAI_CLIENT is None:
+                        if Config.COMPLETION_BACKEND == "offline":
+                                Config.OPENAI_CLIENT = OfflineOpenAI(Config.OFFLINE_BACKEND)
+                        else:
+                                Config.OPENAI_CLIENT = OpenAI(api_key = Config.OPENAI_API_KEY)
+                return Config.OPENAI_CLIENT
+
+        @staticmethod
+        def async_openai_client() -> AsyncOpenAI:
+                if Config.ASYNC_OPENAI_CLIENT is None:
+                        if Config.COMPLETION_BACKEND == "offline":
+                                Config.ASYNC_OPENAI_CLIENT = OfflineAsyncOpenAI(Config.OFFLINE_BACKEND)
+                        else:
+                                Config.ASYNC_OPENAI_CLIENT = AsyncOpenAI(api_key = Config.OPENAI_API_KEY)
+                return Config.ASYNC_OPENAI_CLIENT
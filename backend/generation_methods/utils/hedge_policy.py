@@ -0,0 +1,65 @@
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+class HedgePolicy:
+    """Per-call deadlines, when to fire a duplicate (hedged) request, and when to fall back to another model."""
+
+    def __init__(self, primary_model: str, fallback_model: Optional[str] = None, deadline_seconds: float = 60.0,
+                 hedge_percentile: float = 0.95, hedge_delay_seconds: float = 15.0, max_hedges: int = 1,
+                 min_samples: int = 20, window: int = 500, fallback_after: int = 3,
+                 fallback_cooldown_seconds: float = 300.0):
+        self.primary_model = primary_model
+        self.fallback_model = fallback_model if fallback_model != primary_model else None
+        self.deadline_seconds = deadline_seconds
+        self.hedge_percentile = hedge_percentile
+        # Used until a model has min_samples latencies to take the percentile of
+        self.hedge_delay_seconds = hedge_delay_seconds
+        self.max_hedges = max_hedges
+        self.min_samples = min_samples
+        self.window = window
+        self.fallback_after = fallback_after
+        self.fallback_cooldown_seconds = fallback_cooldown_seconds
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._consecutive_failures = 0
+        self._fallback_until = 0.0
+
+    def model(self) -> str:
+        """The fallback model while the primary is cooling down after repeated failures, otherwise the primary."""
+        if self.fallback_model and time.monotonic() < self._fallback_until:
+            return self.fallback_model
+        return self.primary_model
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Seconds to wait for an attempt before hedging it, or None when hedging is off."""
+        if self.max_hedges <= 0:
+            return None
+
+        latencies = self._latencies.get(model)
+        if not latencies or len(latencies) < self.min_samples:
+            return min(self.hedge_delay_seconds, self.deadline_seconds)
+
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(self.hedge_percentile * len(ordered)))]
+
+    def record_latency(self, model: str, seconds: float):
+        # Attempts cancelled because another one won are recorded with the time they ran, a lower bound
+        self._latencies.setdefault(model, deque(maxlen = self.window)).append(seconds)
+
+    def record_success(self, model: str):
+        if model == self.primary_model:
+            self._consecutive_failures = 0
+
+    def record_failure(self, model: str) -> bool:
+        """Counts a failed or timed out call and returns True if it switched calls over to the fallback model."""
+        # Attempts still in flight when calls were switched over must not restart the cooldown
+        if model != self.primary_model or not self.fallback_model or time.monotonic() < self._fallback_until:
+            return False
+
+        self._consecutive_failures += 1
+        if self._consecutive_failures < self.fallback_after:
+            return False
+
+        self._consecutive_failures = 0
+        self._fallback_until = time.monotonic() + self.fallback_cooldown_seconds
+        return True
@@ -0,0 +1,236 @@
+import threading
+from collections import OrderedDict, defaultdict
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+class RequestMetrics:
+    """Completion totals for one request (or background job), plus the labels its calls are recorded under."""
+
+    def __init__(self, endpoint: str, course_id: Optional[str] = None):
+        self.endpoint = endpoint
+        self.course_id = course_id
+        self.calls = 0
+        self.seconds = 0.0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.completion_tokens = 0
+
+def _format_labels(labels: Dict[str, object]) -> str:
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in labels.values())
+    return ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped))
+
+_current: ContextVar[Optional[RequestMetrics]] = ContextVar("completion_request_metrics", default = None)
+
+class CompletionMetrics:
+    """Aggregates every completion call per endpoint and per course and renders them for Prometheus."""
+
+    DURATION_BUCKETS: Tuple[float, ...] = (0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+    def __init__(self, prompt_cost_per_million: float, completion_cost_per_million: float, max_courses: int = 1000,
+                 cached_prompt_cost_per_million: Optional[float] = None):
+        self.prompt_cost_per_million = prompt_cost_per_million
+        self.cached_prompt_cost_per_million = (prompt_cost_per_million if cached_prompt_cost_per_million is None
+                                               else cached_prompt_cost_per_million)
+        self.completion_cost_per_million = completion_cost_per_million
+        self.max_courses = max_courses
+        # The sync completion path may run from worker threads
+        self._lock = threading.Lock()
+        self._calls: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self._tokens: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self._duration_buckets: Dict[Tuple[str, str], List[int]] = {}
+        self._duration_sum: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._duration_count: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._retries: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._short_responses: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._validation_failures: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._hedges: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._attempt_wins: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self._fallbacks: Dict[str, int] = defaultdict(int)
+        self._cost: Dict[str, float] = defaultdict(float)
+        # Most recently active courses only, so the label set stays bounded
+        self._courses: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+
+    def start_request(self, endpoint: str) -> RequestMetrics:
+        request_metrics = RequestMetrics(endpoint)
+        _current.set(request_metrics)
+        return request_metrics
+
+    def label_course(self, course_id: str):
+        request_metrics = _current.get()
+        if request_metrics is None:
+            request_metrics = self.start_request("unknown")
+        request_metrics.course_id = course_id
+
+    def cost(self, prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int = 0) -> float:
+        """cached_prompt_tokens are the part of prompt_tokens served from the provider's prompt cache."""
+        return ((prompt_tokens - cached_prompt_tokens) * self.prompt_cost_per_million
+                + cached_prompt_tokens * self.cached_prompt_cost_per_million
+                + completion_tokens * self.completion_cost_per_million) / 1_000_000
+
+    def record_call(self, model: str, outcome: str, seconds: Optional[float] = None, prompt_tokens: int = 0,
+                    completion_tokens: int = 0, cached_prompt_tokens: int = 0):
+        """outcome is one of "success", "cached", "invalid", "timeout" or "error".
+
+        seconds is the wall time of the call, None when it never reached the API, which keeps it out of the histogram.
+        """
+        request_metrics = _current.get()
+        endpoint = request_metrics.endpoint if request_metrics else "unknown"
+        course_id = request_metrics.course_id if request_metrics else None
+        cost = self.cost(prompt_tokens, completion_tokens, cached_prompt_tokens)
+
+        with self._lock:
+            self._calls[(endpoint, model, outcome)] += 1
+            if outcome == "cached":
+                return
+
+            if seconds is not None:
+                key = (endpoint, model)
+                buckets = self._duration_buckets.setdefault(key, [0] * len(self.DURATION_BUCKETS))
+                for index, bound in enumerate(self.DURATION_BUCKETS):
+                    if seconds <= bound:
+                        buckets[index] += 1
+                self._duration_sum[key] += seconds
+                self._duration_count[key] += 1
+            self._tokens[(endpoint, model, "prompt")] += prompt_tokens
+            self._tokens[(endpoint, model, "cached_prompt")] += cached_prompt_tokens
+            self._tokens[(endpoint, model, "completion")] += completion_tokens
+            self._cost[endpoint] += cost
+
+            if course_id:
+                course = self._courses.pop(course_id, None) or {"calls": 0, "seconds": 0.0, "prompt_tokens": 0,
+                                                                 "cached_prompt_tokens": 0, "completion_tokens": 0,
+                                                                 "cost": 0.0}
+                course["calls"] += 1
+                course["seconds"] += seconds or 0.0
+                course["prompt_tokens"] += prompt_tokens
+                course["cached_prompt_tokens"] += cached_prompt_tokens
+                course["completion_tokens"] += completion_tokens
+                course["cost"] += cost
+                self._courses[course_id] = course
+                while len(self._courses) > self.max_courses:
+                    self._courses.popitem(last = False)
+
+        if request_metrics:
+            request_metrics.calls += 1
+            request_metrics.seconds += seconds or 0.0
+            request_metrics.prompt_tokens += prompt_tokens
+            request_metrics.cached_prompt_tokens += cached_prompt_tokens
+            request_metrics.completion_tokens += completion_tokens
+
+    def _count(self, counter: Dict[Tuple[str, str], int], kind: str):
+        request_metrics = _current.get()
+        endpoint = request_metrics.endpoint if request_metrics else "unknown"
+        with self._lock:
+            counter[(endpoint, kind)] += 1
+
+    def record_retry(self, kind: str):
+        self._count(self._retries, kind)
+
+    def record_short_response(self, kind: str):
+        self._count(self._short_responses, kind)
+
+    def record_validation_failure(self, kind: str):
+        self._count(self._validation_failures, kind)
+
+    def record_hedge(self, model: str):
+        self._count(self._hedges, model)
+
+    def record_attempt_win(self, model: str, attempt: str):
+        """attempt is "primary" for the original request or "hedge" for a duplicate fired after it."""
+        request_metrics = _current.get()
+        endpoint = request_metrics.endpoint if request_metrics else "unknown"
+        with self._lock:
+            self._attempt_wins[(endpoint, model, attempt)] += 1
+
+    def record_fallback(self, model: str):
+        with self._lock:
+            self._fallbacks[model] += 1
+
+    def totals(self) -> Dict[str, float]:
+        """Sums over every endpoint and model, e.g. to compare benchmark runs."""
+        with self._lock:
+            totals = {"calls": sum(count for (_, _, outcome), count in self._calls.items() if outcome != "cached"),
+                      "cost": sum(self._cost.values())}
+            for token_type in ("prompt", "cached_prompt", "completion"):
+                totals[f"{token_type}_tokens"] = sum(count for (_, _, kind), count in self._tokens.items()
+                                                     if kind == token_type)
+        return totals
+
+    def render(self, cache_stats: Optional[Dict[str, int]] = None) -> str:
+        """Prometheus text exposition format, cache_stats are CompletionCache.stats() of the completion cache."""
+        lines = []
+
+        def metric(name: str, metric_type: str, help_text: str, samples: List[Tuple[Dict[str, str], float]]):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{name}{{{_format_labels(labels)}}} {value}" if labels else f"{name} {value}")
+
+        with self._lock:
+            metric("llm_completion_calls_total", "counter", "Completion calls by outcome",
+                   [({"endpoint": endpoint, "model": model, "outcome": outcome}, count)
+                    for (endpoint, model, outcome), count in self._calls.items()])
+
+            lines.append("# HELP llm_completion_duration_seconds Wall time of completion calls")
+            lines.append("# TYPE llm_completion_duration_seconds histogram")
+            for (endpoint, model), buckets in self._duration_buckets.items():
+                labels = {"endpoint": endpoint, "model": model}
+                count = self._duration_count[(endpoint, model)]
+                for bound, bucket_count in zip(self.DURATION_BUCKETS + ("+Inf",), buckets + [count]):
+                    lines.append(f"llm_completion_duration_seconds_bucket{{{_format_labels({**labels, 'le': bound})}}} "
+                                 f"{bucket_count}")
+                lines.append(f"llm_completion_duration_seconds_sum{{{_format_labels(labels)}}} "
+                             f"{self._duration_sum[(endpoint, model)]}")
+                lines.append(f"llm_completion_duration_seconds_count{{{_format_labels(labels)}}} {count}")
+
+            metric("llm_tokens_total", "counter", "Tokens used by completion calls, cached_prompt is part of prompt",
+                   [({"endpoint": endpoint, "model": model, "type": token_type}, count)
+                    for (endpoint, model, token_type), count in self._tokens.items()])
+            metric("llm_cost_usd_total", "counter", "Estimated completion cost in US dollars",
+                   [({"endpoint": endpoint}, cost) for endpoint, cost in self._cost.items()])
+            metric("llm_retries_total", "counter", "Extra attempts made because a response was short or failed",
+                   [({"endpoint": endpoint, "kind": kind}, count) for (endpoint, kind), count in self._retries.items()])
+            metric("llm_short_responses_total", "counter", "Responses still short after the last attempt",
+                   [({"endpoint": endpoint, "kind": kind}, count)
+                    for (endpoint, kind), count in self._short_responses.items()])
+            metric("llm_validation_failures_total", "counter", "Responses that did not match their schema",
+                   [({"endpoint": endpoint, "kind": kind}, count)
+                    for (endpoint, kind), count in self._validation_failures.items()])
+
+            metric("llm_hedged_requests_total", "counter", "Duplicate requests fired because an attempt was slow",
+                   [({"endpoint": endpoint, "model": model}, count) for (endpoint, model), count in self._hedges.items()])
+            metric("llm_attempt_wins_total", "counter", "Completion calls by the attempt whose result was used",
+                   [({"endpoint": endpoint, "model": model, "attempt": attempt}, count)
+                    for (endpoint, model, attempt), count in self._attempt_wins.items()])
+            metric("llm_model_fallbacks_total", "counter", "Times calls were switched over to the fallback model",
+                   [({"model": model}, count) for model, count in self._fallbacks.items()])
+
+            course_samples = {"calls": [], "seconds": [], "prompt_tokens": [], "cached_prompt_tokens": [],
+                              "completion_tokens": [], "cost": []}
+            for course_id, course in self._courses.items():
+                for field in course_samples:
+                    course_samples[field].append(({"course_id": course_id}, course[field]))
+            metric("llm_course_calls_total", "counter", "Completion calls per course", course_samples["calls"])
+            metric("llm_course_duration_seconds_total", "counter", "Completion wall time per course",
+                   course_samples["seconds"])
+            metric("llm_course_prompt_tokens_total", "counter", "Prompt tokens per course",
+                   course_samples["prompt_tokens"])
+            metric("llm_course_cached_prompt_tokens_total", "counter", "Cached prompt tokens per course",
+                   course_samples["cached_prompt_tokens"])
+            metric("llm_course_completion_tokens_total", "counter", "Completion tokens per course",
+                   course_samples["completion_tokens"])
+            metric("llm_course_cost_usd_total", "counter", "Estimated cost per course in US dollars",
+                   course_samples["cost"])
+
+        if cache_stats is not None:
+            metric("llm_completion_cache_hits_total", "counter", "Completions answered from the cache",
+                   [({"tier": "memory"}, cache_stats["memory_hits"]),
+                    ({"tier": "persistent"}, cache_stats["persistent_hits"])])
+            metric("llm_completion_cache_misses_total", "counter", "Cache lookups that went to the API",
+                   [({}, cache_stats["misses"])])
+            metric("llm_completion_cache_entries", "gauge", "Completions held in memory",
+                   [({}, cache_stats["entries"])])
+            metric("llm_completion_cache_evicted_total", "counter", "Expired rows removed from the persistent tier",
+                   [({}, cache_stats["evicted"])])
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,235 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+import httpx
+from jiter import from_json
+from openai import InternalServerError
+from openai.lib.streaming.chat import ContentDeltaEvent
+from openai.types import CompletionUsage
+from openai.types.chat import ParsedChatCompletion, ParsedChoice, ParsedChatCompletionMessage
+from openai.types.completion_usage import PromptTokensDetails
+from ..formats.schema_registry import SchemaRegistry
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "examples")
+
+class OfflineBackend:
+    """Serves the demo_completions fixtures in place of the OpenAI API, for load testing without a network.
+
+    Responses are validated against the requested response format, so callers get exactly what a real
+    structured output would give them. Latency, failures and short responses are drawn from a seeded
+    random generator so that a run can be repeated. Prompt caching is simulated the way the provider
+    does it: a repeated system prompt and schema prefix of at least 1024 tokens is cached in 128 token steps.
+    """
+
+    CHUNK_SIZE: int = 64
+    PROMPT_CACHE_MIN_TOKENS: int = 1024
+    PROMPT_CACHE_INCREMENT: int = 128
+
+    def __init__(self, latency_distribution: str = "lognormal", latency_mean: float = 2.0, latency_stddev: float = 1.0,
+                 failure_rate: float = 0.0, short_response_rate: float = 0.0, seed: Optional[int] = None):
+        if latency_distribution not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {latency_distribution}")
+
+        self.latency_distribution = latency_distribution
+        self.latency_mean = latency_mean
+        self.latency_stddev = latency_stddev
+        self.failure_rate = failure_rate
+        self.short_response_rate = short_response_rate
+        self._random = random.Random(seed)
+        self._fixtures: Optional[Dict[str, List[Dict]]] = None
+        self._cached_prefixes = set()
+
+    def _load_fixtures(self) -> Dict[str, List[Dict]]:
+        if self._fixtures is None:
+            with open(os.path.join(EXAMPLES_DIR, "demo_completions_flashcards.jsonl")) as f:
+                flashcards = [json.loads(line) for line in f if line.strip()]
+            with open(os.path.join(EXAMPLES_DIR, "demo_completions_quiz.jsonl")) as f:
+                quizzes = [json.loads(line) for line in f if line.strip()]
+            with open(os.path.join(EXAMPLES_DIR, "demo_completions_weekly_schedule.json")) as f:
+                schedules = [json.load(f)]
+            with open(os.path.join(EXAMPLES_DIR, "demo_completions_weekly_material.json")) as f:
+                material = json.load(f)
+
+            # The weekly material holds one more flashcard deck and revision quiz per day
+            days = [value for key, value in material.items() if key.startswith("day_")]
+            flashcards += [day["flashcard_deck"] for day in days if "flashcard_deck" in day]
+            quizzes += [day["revision_quiz"] for day in days if "revision_quiz" in day]
+
+            self._fixtures = {"flashcard_pairs": flashcards, "quiz_questions": quizzes, "day_1": schedules}
+        return self._fixtures
+
+    def latency(self) -> float:
+        if self.latency_distribution == "fixed" or self.latency_stddev <= 0:
+            return self.latency_mean
+        if self.latency_distribution == "uniform":
+            spread = self.latency_stddev * math.sqrt(3)
+            return max(0.0, self._random.uniform(self.latency_mean - spread, self.latency_mean + spread))
+
+        # Lognormal with the configured mean and standard deviation, which gives the long tail real APIs have
+        sigma = math.sqrt(math.log(1 + (self.latency_stddev / self.latency_mean) ** 2))
+        mu = math.log(self.latency_mean) - sigma ** 2 / 2
+        return self._random.lognormvariate(mu, sigma)
+
+    def _failure(self) -> Optional[Exception]:
+        if self._random.random() >= self.failure_rate:
+            return None
+        request = httpx.Request("POST", "https://offline.invalid/v1/chat/completions")
+        return InternalServerError("Offline backend injected failure",
+                                   response = httpx.Response(500, request = request), body = None)
+
+    def _pick_fixture(self, messages: List[Dict], response_format: type) -> Dict:
+        user_prompt = next((message["content"] for message in messages if message["role"] == "user"), "")
+        index = int(hashlib.sha256(user_prompt.encode()).hexdigest(), 16)
+
+        # Combined formats (e.g. a whole day's content) get one fixture of each kind they contain
+        event = {}
+        for field, fixtures in self._load_fixtures().items():
+            if field not in response_format.model_fields:
+                continue
+            # Prefer a fixture on the requested topic, otherwise pick one deterministically from the prompt
+            matching = [fixture for fixture in fixtures if fixture.get("topic", "").lower() in user_prompt.lower()]
+            candidates = matching or fixtures
+            event.update(json.loads(json.dumps(candidates[index % len(candidates)])))
+
+        if not event:
+            raise ValueError(f"No offline fixtures for {response_format.__name__}")
+        return event
+
+    def _shorten(self, event: Dict) -> Dict:
+        for key, value in event.items():
+            if isinstance(value, list) and len(value) > 1:
+                event[key] = value[:self._random.randint(1, len(value) - 1)]
+        return event
+
+    def _cached_tokens(self, messages: List[Dict], response_format: type) -> int:
+        system_prompt = next((message["content"] for message in messages if message["role"] == "system"), "")
+        prefix = json.dumps(SchemaRegistry.response_format(response_format)) + system_prompt
+        prefix_tokens = len(prefix) // 4
+        if prefix_tokens < self.PROMPT_CACHE_MIN_TOKENS:
+            return 0
+
+        prefix_hash = hashlib.sha256(prefix.encode()).hexdigest()
+        if prefix_hash not in self._cached_prefixes:
+            self._cached_prefixes.add(prefix_hash)
+            return 0
+        return prefix_tokens - prefix_tokens % self.PROMPT_CACHE_INCREMENT
+
+    def respond(self, messages: List[Dict], response_format) -> Tuple[float, Optional[Exception], ParsedChatCompletion]:
+        """Returns the latency to simulate, the failure to raise (if any) and the completion.
+
+        response_format is a ResponseFormats class or the dict SchemaRegistry compiled from one.
+        """
+        response_format = SchemaRegistry.lookup(response_format)
+        latency = self.latency()
+        failure = self._failure()
+
+        event = self._pick_fixture(messages, response_format)
+        if self._random.random() < self.short_response_rate:
+            event = self._shorten(event)
+
+        parsed = response_format.model_validate(event)
+        content = parsed.model_dump_json()
+        prompt_tokens = sum(len(message["content"]) for message in messages) // 4
+        completion_tokens = len(content) // 4
+        cached_tokens = min(self._cached_tokens(messages, response_format), prompt_tokens)
+
+        completion = ParsedChatCompletion[response_format](
+            id = f"chatcmpl-offline-{uuid.uuid4().hex}",
+            object = "chat.completion",
+            created = int(time.time()),
+            model = "offline",
+            choices = [ParsedChoice[response_format](
+                index = 0,
+                finish_reason = "stop",
+                message = ParsedChatCompletionMessage[response_format](role = "assistant", content = content,
+                                                                       parsed = parsed))],
+            usage = CompletionUsage(prompt_tokens = prompt_tokens, completion_tokens = completion_tokens,
+                                    total_tokens = prompt_tokens + completion_tokens,
+                                    prompt_tokens_details = PromptTokensDetails(cached_tokens = cached_tokens)))
+        return latency, failure, completion
+
+
+class _OfflineStream:
+    def __init__(self, backend: OfflineBackend, messages: List[Dict], response_format):
+        self._latency, self._failure, self._completion = backend.respond(messages, response_format)
+        self._chunk_size = backend.CHUNK_SIZE
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def __aiter__(self):
+        return self._events()
+
+    async def _events(self):
+        content = self._completion.choices[0].message.content
+        chunks = max(1, math.ceil(len(content) / self._chunk_size))
+        for index in range(chunks):
+            await asyncio.sleep(self._latency / chunks)
+            # Fail part way through, the way a dropped connection would
+            if self._failure is not None and index >= chunks // 2:
+                raise self._failure
+
+            snapshot = content[:(index + 1) * self._chunk_size]
+            yield ContentDeltaEvent(type = "content.delta",
+                                    delta = snapshot[index * self._chunk_size:],
+                                    snapshot = snapshot,
+                                    parsed = from_json(snapshot.encode(), partial_mode = True))
+
+    async def get_final_completion(self) -> ParsedChatCompletion:
+        return self._completion
+
+
+class _OfflineCompletions:
+    def __init__(self, backend: OfflineBackend):
+        self._backend = backend
+
+    def create(self, model: str, messages: List[Dict], response_format, **kwargs) -> ParsedChatCompletion:
+        latency, failure, completion = self._backend.respond(messages, response_format)
+        time.sleep(latency)
+        if failure is not None:
+            raise failure
+        return completion
+
+    parse = create
+
+
+class _OfflineAsyncCompletions(_OfflineCompletions):
+    async def create(self, model: str, messages: List[Dict], response_format, **kwargs) -> ParsedChatCompletion:
+        latency, failure, completion = self._backend.respond(messages, response_format)
+        await asyncio.sleep(latency)
+        if failure is not None:
+            raise failure
+        return completion
+
+    parse = create
+
+    def stream(self, model: str, messages: List[Dict], response_format, **kwargs) -> _OfflineStream:
+        return _OfflineStream(self._backend, messages, response_format)
+
+
+class OfflineOpenAI:
+    """Drop-in for OpenAI().chat.completions and .beta.chat.completions backed by an OfflineBackend."""
+
+    def __init__(self, backend: OfflineBackend):
+        completions = _OfflineCompletions(backend)
+        self.chat = SimpleNamespace(completions = completions)
+        self.beta = SimpleNamespace(chat = SimpleNamespace(completions = completions))
+
+
+class OfflineAsyncOpenAI:
+    """Drop-in for AsyncOpenAI().chat.completions and .beta.chat.completions backed by an OfflineBackend."""
+
+    def __init__(self, backend: OfflineBackend):
+        completions = _OfflineAsyncCompletions(backend)
+        self.chat = SimpleNamespace(completions = completions)
+        self.beta = SimpleNamespace(chat = SimpleNamespace(completions = completions))
@@ -0,0 +1,64 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, List
+
+class RateLimiter:
+    """Sliding one minute window over requests and tokens, shared by every caller in the process."""
+
+    WINDOW_SECONDS: float = 60.0
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._window: Deque[List] = deque()
+        self._tokens_in_window = 0
+        self._lock = asyncio.Lock()
+
+    def _prune(self, now: float):
+        while self._window and now - self._window[0][0] >= self.WINDOW_SECONDS:
+            _, tokens = self._window.popleft()
+            self._tokens_in_window -= tokens
+
+    def _wait_time(self, now: float, tokens: int) -> float:
+        if not self._window:
+            return 0.0
+
+        if len(self._window) >= self.requests_per_minute:
+            return self._window[0][0] + self.WINDOW_SECONDS - now
+
+        if self._tokens_in_window + tokens > self.tokens_per_minute:
+            # Wait for enough of the oldest entries to leave the window
+            freed = 0
+            for timestamp, entry_tokens in self._window:
+                freed += entry_tokens
+                if self._tokens_in_window - freed + tokens <= self.tokens_per_minute:
+                    return timestamp + self.WINDOW_SECONDS - now
+
+            # A single request larger than the budget waits for an empty window
+            return self._window[-1][0] + self.WINDOW_SECONDS - now
+
+        return 0.0
+
+    async def acquire(self, tokens: int) -> List:
+        """Waits until the request fits in the window and returns its entry for later reconciliation."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._prune(now)
+                wait = self._wait_time(now, tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+
+            entry = [now, tokens]
+            self._window.append(entry)
+            self._tokens_in_window += tokens
+
+            return entry
+
+    def reconcile(self, entry: List, actual_tokens: int):
+        """Replaces the estimated token count of an acquired entry with the real usage."""
+        if any(window_entry is entry for window_entry in self._window):
+            self._tokens_in_window += actual_tokens - entry[1]
+        entry[1] = actual_tokens
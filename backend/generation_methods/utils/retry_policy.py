@@ -0,0 +1,15 @@
+import random
+
+class RetryPolicy:
+    """Bounds how often a short or failed completion is retried and how long to wait in between."""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0, top_up: bool = True):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Keep the valid items already received and only ask for the missing ones
+        self.top_up = top_up
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter exponential backoff before retrying after the given (1-based) attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
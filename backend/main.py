@@ -1,53 +1,318 @@
-from fastapi import FastAPI, HTTPException, Depends, Header, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse, PlainTextResponse, Response
 from fastapi.security import OAuth2AuthorizationCodeBearer
 from fastapi.background import BackgroundTasks
-from google.oauth2 import id_token
-from google.auth.transport import requests
+from google.auth import jwt as google_jwt
 from google_auth_oauthlib.flow import Flow
-from sqlalchemy import create_engine, Column, String, DateTime, Text, ForeignKey
+from sqlalchemy import create_engine, Column, String, DateTime, Text, ForeignKey, Integer, Index, inspect, text, func
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from pydantic import BaseModel
 from datetime import datetime, timedelta, date
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, AsyncIterator
+from contextlib import asynccontextmanager, contextmanager
+import asyncio
+import copy
+import gzip
+import hashlib
+import hmac
 import httpx
 import jwt
 import json
 import os
+import time
 import uuid
 import random
-from dotenv import load_dotenv
-from backend.generation_methods.completions import Completions
+import re
+import orjson
+from cachetools import TTLCache, TLRUCache, LRUCache
+
+try:
+    import brotli
+except ImportError:
+    # Without the optional brotli package responses are only gzip compressed
+    brotli = None
+
+from backend.generation_methods.completions import Completions, CompletionFormat
+from backend.generation_methods.utils.config import Config, LazySettings
+from backend.generation_methods.batch import BatchGenerator
+from backend.generation_methods.formats.schema_registry import SchemaRegistry
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema setup runs on startup rather than at import, so importing the app needs no database
+    await asyncio.to_thread(Database.migrate)
+    SchemaRegistry.compile_all()
+
+    # One pooled HTTP client for every Google API call made by this process
+    app.state.http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=Settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=Settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+    )
+    cache_eviction = asyncio.create_task(CompletionFormat.evict_expired_cache()) if Config.COMPLETION_CACHE_ENABLED else None
+    try:
+        yield
+    finally:
+        if cache_eviction is not None:
+            cache_eviction.cancel()
+        await TokenRefresher.stop()
+        # Background generation holds sessions, so it has to stop before the engine is disposed
+        await PregenerationQueue.stop()
+        await GenerationCoordinator.stop()
+        await app.state.http_client.aclose()
+        await Database.dispose()
+
+
+router = APIRouter()
+
 
-# FastAPI app initialization
-app = FastAPI()
+# Completion timings per request
+async def add_timing_headers(request: Request, call_next):
+    started = time.perf_counter()
+    request_metrics = Config.COMPLETION_METRICS.start_request(request.url.path)
 
-load_dotenv()
+    response = await call_next(request)
 
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    # Streaming responses send their headers before generating, so they only report what ran until then
+    response.headers["Server-Timing"] = (
+        f"app;dur={(time.perf_counter() - started) * 1000:.1f}, "
+        f"llm;dur={request_metrics.seconds * 1000:.1f};desc=\"{request_metrics.calls} calls\""
+    )
+    response.headers["X-LLM-Calls"] = str(request_metrics.calls)
+    response.headers["X-LLM-Tokens"] = str(request_metrics.prompt_tokens + request_metrics.completion_tokens)
+    return response
 
 # Configuration
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
-REDIRECT_URI = os.getenv("REDIRECT_URI")
-JWT_SECRET = os.getenv("JWT_SECRET")
-JWT_ALGORITHM = "HS256"
-FRONTEND_URL = os.getenv("FRONTEND_URL")
-
-# Database configuration
-SQLALCHEMY_DATABASE_URL = os.getenv("DB_URL")
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class Settings(metaclass=LazySettings):
+    """Read from .env and the environment the first time a setting is used, so importing the app reads neither."""
+
+    GOOGLE_CLIENT_ID: Optional[str]
+    GOOGLE_CLIENT_SECRET: Optional[str]
+    REDIRECT_URI: Optional[str]
+    JWT_SECRET: Optional[str]
+    JWT_ALGORITHM: str
+    # Asymmetric algorithms verify with the public key, HMAC ones with the secret itself
+    JWT_VERIFY_KEY: Optional[str]
+    JWT_CACHE_SIZE: int
+    # Logouts on other workers take effect here within this many seconds
+    JWT_REVOCATION_REFRESH_SECONDS: float
+    FRONTEND_URL: Optional[str]
+    # Bearer token for /metrics and /db-pool, which are disabled while it is unset
+    METRICS_TOKEN: Optional[str]
+
+    # Shared HTTP client
+    HTTP_MAX_CONNECTIONS: int
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int
+
+    # Background pre-generation of day content
+    PREGENERATION_WORKERS: int
+    PREGENERATE_ALL_DAYS: bool
+
+    # Per-user in-memory cache of Google tokens and task list ids
+    USER_CACHE_SIZE: int
+    USER_TOKEN_CACHE_TTL: int
+    USER_TASK_LIST_CACHE_TTL: int
+
+    # Database configuration
+    SQLALCHEMY_DATABASE_URL: Optional[str]
+    DB_POOL_SIZE: int
+    DB_MAX_OVERFLOW: int
+    DB_POOL_TIMEOUT: int
+    DB_POOL_RECYCLE: int
+
+    # Large JSON responses are compressed when the client accepts it
+    COMPRESSION_MIN_BYTES: int
+    # Encoded day content bodies kept per ETag, so repeat requests skip loading the content
+    RESPONSE_BODY_CACHE_SIZE: int
+
+    @staticmethod
+    def settings() -> dict:
+        jwt_secret = os.getenv("JWT_SECRET")
+        return {
+            "GOOGLE_CLIENT_ID": os.getenv("GOOGLE_CLIENT_ID"),
+            "GOOGLE_CLIENT_SECRET": os.getenv("GOOGLE_CLIENT_SECRET"),
+            "REDIRECT_URI": os.getenv("REDIRECT_URI"),
+            "JWT_SECRET": jwt_secret,
+            "JWT_ALGORITHM": os.getenv("JWT_ALGORITHM") or "HS256",
+            "JWT_VERIFY_KEY": os.getenv("JWT_VERIFY_KEY") or jwt_secret,
+            "JWT_CACHE_SIZE": int(os.getenv("JWT_CACHE_SIZE") or 10000),
+            "JWT_REVOCATION_REFRESH_SECONDS": float(os.getenv("JWT_REVOCATION_REFRESH_SECONDS") or 5),
+            "FRONTEND_URL": os.getenv("FRONTEND_URL"),
+            "METRICS_TOKEN": os.getenv("METRICS_TOKEN"),
+            "HTTP_MAX_CONNECTIONS": int(os.getenv("HTTP_MAX_CONNECTIONS") or 100),
+            "HTTP_MAX_KEEPALIVE_CONNECTIONS": int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS") or 20),
+            "PREGENERATION_WORKERS": int(os.getenv("PREGENERATION_WORKERS") or 2),
+            "PREGENERATE_ALL_DAYS": (os.getenv("PREGENERATE_ALL_DAYS") or "false").lower() == "true",
+            "USER_CACHE_SIZE": int(os.getenv("USER_CACHE_SIZE") or 10000),
+            "USER_TOKEN_CACHE_TTL": int(os.getenv("USER_TOKEN_CACHE_TTL") or 300),
+            "USER_TASK_LIST_CACHE_TTL": int(os.getenv("USER_TASK_LIST_CACHE_TTL") or 3600),
+            "SQLALCHEMY_DATABASE_URL": os.getenv("DB_URL"),
+            "DB_POOL_SIZE": int(os.getenv("DB_POOL_SIZE") or 10),
+            "DB_MAX_OVERFLOW": int(os.getenv("DB_MAX_OVERFLOW") or 20),
+            "DB_POOL_TIMEOUT": int(os.getenv("DB_POOL_TIMEOUT") or 30),
+            "DB_POOL_RECYCLE": int(os.getenv("DB_POOL_RECYCLE") or 1800),
+            "COMPRESSION_MIN_BYTES": int(os.getenv("COMPRESSION_MIN_BYTES") or 1024),
+            "RESPONSE_BODY_CACHE_SIZE": int(os.getenv("RESPONSE_BODY_CACHE_SIZE") or 256),
+        }
+
+# Shared HTTP client
+HTTP_KEEPALIVE_EXPIRY = 30.0
+HTTP_TIMEOUT = 10.0
+HTTP_CONNECT_TIMEOUT = 5.0
+
+# Cross-worker generation claims older than this are considered abandoned
+GENERATION_CLAIM_TIMEOUT = timedelta(minutes=5)
+GENERATION_POLL_INTERVAL = 1.0
+
+# Background pre-generation of day content
+# Queue priorities, lower runs first: the day a user is likely to open next goes ahead of warming the week
+NEXT_DAY_PRIORITY = 0
+WEEK_DAY_PRIORITY = 10
+
+# Google access tokens are refreshed in the background this long before they expire
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+TOKEN_REFRESH_INTERVAL = 60.0
+# Users without a request for this long are no longer refreshed ahead of time
+TOKEN_REFRESH_IDLE = timedelta(hours=1)
+
+# Postgres advisory lock key held while a worker runs the startup migrations
+MIGRATION_LOCK_ID = 7351946021
+
+# Large JSON responses are compressed when the client accepts it
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def to_async_database_url(url: str) -> str:
+    for sync_prefix, async_prefix in (("postgresql+psycopg2://", "postgresql+asyncpg://"),
+                                      ("postgresql://", "postgresql+asyncpg://"),
+                                      ("postgres://", "postgresql+asyncpg://"),
+                                      ("sqlite://", "sqlite+aiosqlite://")):
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
+
+def to_async_engine_args(url: str) -> tuple:
+    """Returns the async engine's URL and connect_args for a sync DB_URL.
+
+    asyncpg has no sslmode keyword, so a libpq style ?sslmode= is passed on as its ssl argument instead.
+    """
+    async_url = make_url(to_async_database_url(url))
+    connect_args = {}
+    if async_url.drivername == 'postgresql+asyncpg' and 'sslmode' in async_url.query:
+        connect_args['ssl'] = async_url.query['sslmode']
+        async_url = async_url.difference_update_query(['sslmode'])
+    return async_url, connect_args
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a connection."""
+
+    checkouts = 0
+    total_wait = 0.0
+    max_wait = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait = time.perf_counter() - start
+            InstrumentedPool.checkouts += 1
+            InstrumentedPool.total_wait += wait
+            InstrumentedPool.max_wait = max(InstrumentedPool.max_wait, wait)
+
+
+class Database:
+    """Engines and session factory for DB_URL, created on first use so importing the app needs no database."""
+
+    _engine: Optional[Engine] = None
+    _async_engine: Optional[AsyncEngine] = None
+    _session_factory: Optional[async_sessionmaker] = None
+    _migrated = False
+
+    @staticmethod
+    def engine() -> Engine:
+        # The sync engine is only used for schema management at startup
+        if Database._engine is None:
+            Database._engine = create_engine(Settings.SQLALCHEMY_DATABASE_URL)
+        return Database._engine
+
+    @staticmethod
+    def async_engine() -> AsyncEngine:
+        if Database._async_engine is None:
+            url, connect_args = to_async_engine_args(Settings.SQLALCHEMY_DATABASE_URL)
+            Database._async_engine = create_async_engine(
+                url,
+                connect_args=connect_args,
+                poolclass=InstrumentedPool,
+                pool_size=Settings.DB_POOL_SIZE,
+                max_overflow=Settings.DB_MAX_OVERFLOW,
+                pool_timeout=Settings.DB_POOL_TIMEOUT,
+                pool_recycle=Settings.DB_POOL_RECYCLE,
+                pool_pre_ping=True
+            )
+        return Database._async_engine
+
+    @staticmethod
+    def session() -> AsyncSession:
+        if Database._session_factory is None:
+            Database._session_factory = async_sessionmaker(Database.async_engine(), autoflush=False,
+                                                           expire_on_commit=False)
+        return Database._session_factory()
+
+    @staticmethod
+    @contextmanager
+    def migration_lock():
+        """Lets one worker at a time migrate, the others find the work done once they get the lock."""
+        if Database.engine().dialect.name != 'postgresql':
+            yield
+            return
+
+        with Database.engine().connect() as connection:
+            connection.execute(text("SELECT pg_advisory_lock(:id)"), {'id': MIGRATION_LOCK_ID})
+            try:
+                yield
+            finally:
+                connection.execute(text("SELECT pg_advisory_unlock(:id)"), {'id': MIGRATION_LOCK_ID})
+
+    @staticmethod
+    def migrate():
+        """Creates missing tables and indexes and migrates legacy data, once per process."""
+        if Database._migrated:
+            return
+
+        # Workers start together and would otherwise copy the legacy content side by side
+        with Database.migration_lock():
+            Base.metadata.create_all(bind=Database.engine())
+            migrate_day_content_columns()
+            migrate_day_content_hashes()
+            create_missing_indexes()
+            migrate_token_encoding()
+        # Requests only use the async engine
+        Database.engine().dispose()
+        Database._migrated = True
+
+    @staticmethod
+    async def dispose():
+        if Database._async_engine is not None:
+            await Database._async_engine.dispose()
+
+
 Base = declarative_base()
 
 # OAuth2 scopes
@@ -58,6 +323,15 @@ SCOPES = [
     "https://www.googleapis.com/auth/tasks"
 ]
 
+GOOGLE_AUTH_URI = "https://accounts.google.com/o/oauth2/auth"
+GOOGLE_TOKEN_URI = "https://oauth2.googleapis.com/token"
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+# Used when Google's certs response carries no max-age
+GOOGLE_CERTS_DEFAULT_TTL = 3600
+# Unknown key ids refetch the certs at most this often
+GOOGLE_CERTS_MIN_REFRESH = 60
+
 
 # Database Models
 class Users(Base):
@@ -87,100 +361,283 @@ class UserTokens(Base):
 class Courses(Base):
     __tablename__ = "courses"
 
+    __table_args__ = (
+        # Ownership checks look courses up by (user_id, id)
+        Index('ix_courses_user_id_id', 'user_id', 'id'),
+    )
+
     id = Column(String, primary_key=True)
-    user_id = Column(String, ForeignKey('users.id'))
+    user_id = Column(String, ForeignKey('users.id'), index=True)
     topic = Column(String, nullable=False)
     img_id = Column(String, nullable=False)
-    schedule = Column(JSONB)
-    day_1_flashcards = Column(JSONB, nullable=True)
-    day_1_quiz = Column(JSONB, nullable=True)
-    day_2_flashcards = Column(JSONB, nullable=True)
-    day_2_quiz = Column(JSONB, nullable=True)
-    day_3_flashcards = Column(JSONB, nullable=True)
-    day_3_quiz = Column(JSONB, nullable=True)
-    day_4_flashcards = Column(JSONB, nullable=True)
-    day_4_quiz = Column(JSONB, nullable=True)
-    day_5_flashcards = Column(JSONB, nullable=True)
-    day_5_quiz = Column(JSONB, nullable=True)
-    day_6_flashcards = Column(JSONB, nullable=True)
-    day_6_quiz = Column(JSONB, nullable=True)
-    day_7_flashcards = Column(JSONB, nullable=True)
-    day_7_quiz = Column(JSONB, nullable=True)
+    # Only loaded when accessed, course listings never need it
+    schedule = deferred(Column(JSONB))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class CourseDayContent(Base):
+    __tablename__ = "course_day_content"
+
+    course_id = Column(String, ForeignKey('courses.id', ondelete='CASCADE'), primary_key=True)
+    day_number = Column(Integer, primary_key=True)
+    # "flashcards" or "quiz"
+    kind = Column(String, primary_key=True)
+    content = Column(JSONB, nullable=False)
+    # SHA-256 of the content, so ETags never need the JSONB itself
+    content_hash = Column(String(64))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class RevokedTokens(Base):
+    __tablename__ = "revoked_tokens"
+
+    # SHA-256 of the JWT, the token itself is never stored
+    token_hash = Column(String(64), primary_key=True)
+    # The token's own expiry, after which the row is no longer needed
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class CourseDayClaims(Base):
+    __tablename__ = "course_day_claims"
+
+    course_id = Column(String, ForeignKey('courses.id', ondelete='CASCADE'), primary_key=True)
+    day_number = Column(Integer, primary_key=True)
+    claimed_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Per-user Cache
+class UserCache:
+    """Keeps each user's decoded Google tokens and default task list id in memory."""
+    _token_cache: Optional[TTLCache] = None
+    _task_list_cache: Optional[TTLCache] = None
+
+    @staticmethod
+    def _tokens() -> TTLCache:
+        if UserCache._token_cache is None:
+            UserCache._token_cache = TTLCache(maxsize=Settings.USER_CACHE_SIZE, ttl=Settings.USER_TOKEN_CACHE_TTL)
+        return UserCache._token_cache
+
+    @staticmethod
+    def _task_lists() -> TTLCache:
+        if UserCache._task_list_cache is None:
+            UserCache._task_list_cache = TTLCache(maxsize=Settings.USER_CACHE_SIZE, ttl=Settings.USER_TASK_LIST_CACHE_TTL)
+        return UserCache._task_list_cache
+
+    @staticmethod
+    def get_tokens(user_id: str) -> Optional[dict]:
+        tokens = UserCache._tokens().get(user_id)
+        return copy.deepcopy(tokens) if tokens is not None else None
+
+    @staticmethod
+    def set_tokens(user_id: str, tokens: dict):
+        UserCache._tokens()[user_id] = copy.deepcopy(tokens)
+
+    @staticmethod
+    def get_task_list_id(user_id: str) -> Optional[str]:
+        return UserCache._task_lists().get(user_id)
+
+    @staticmethod
+    def set_task_list_id(user_id: str, task_list_id: str):
+        UserCache._task_lists()[user_id] = task_list_id
+
+    @staticmethod
+    def invalidate_task_list(user_id: str):
+        UserCache._task_lists().pop(user_id, None)
+
+    @staticmethod
+    def invalidate(user_id: str):
+        UserCache._tokens().pop(user_id, None)
+        UserCache._task_lists().pop(user_id, None)
+
+
+class TaskCreate(BaseModel):
+    title: str
+    due_date: date
+
+
 class TaskManager:
     @staticmethod
-    async def get_default_task_list(access_token: str) -> str:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                'https://tasks.googleapis.com/tasks/v1/users/@me/lists',
-                headers={'Authorization': f'Bearer {access_token}'}
-            )
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code,
-                                    detail="Failed to get task lists")
+    async def get_default_task_list(client: httpx.AsyncClient, access_token: str) -> str:
+        response = await client.get(
+            'https://tasks.googleapis.com/tasks/v1/users/@me/lists',
+            headers={'Authorization': f'Bearer {access_token}'}
+        )
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code,
+                                detail="Failed to get task lists")
 
-            task_lists = response.json().get('items', [])
-            if not task_lists:
-                raise HTTPException(status_code=404, detail="No task list found")
+        task_lists = response.json().get('items', [])
+        if not task_lists:
+            raise HTTPException(status_code=404, detail="No task list found")
 
-            return task_lists[0]['id']
+        return task_lists[0]['id']
 
     @staticmethod
-    async def create_task(access_token: str, task_list_id: str, title: str, due_date: date) -> dict:
+    async def create_task(client: httpx.AsyncClient, access_token: str, task_list_id: str, title: str,
+                          due_date: date) -> dict:
         task_data = {
             'title': title,
             'due': f"{due_date}T00:00:00.000Z"
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f'https://tasks.googleapis.com/tasks/v1/lists/{task_list_id}/tasks',
-                headers={
-                    'Authorization': f'Bearer {access_token}',
-                    'Content-Type': 'application/json'
-                },
-                json=task_data
-            )
+        response = await client.post(
+            f'https://tasks.googleapis.com/tasks/v1/lists/{task_list_id}/tasks',
+            headers={
+                'Authorization': f'Bearer {access_token}',
+                'Content-Type': 'application/json'
+            },
+            json=task_data
+        )
 
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code,
-                                    detail="Failed to create task")
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code,
+                                detail="Failed to create task")
 
-            return response.json()
+        return response.json()
 
+    @staticmethod
+    async def get_cached_task_list(client: httpx.AsyncClient, user_id: str, access_token: str) -> str:
+        task_list_id = UserCache.get_task_list_id(user_id)
+        if task_list_id is None:
+            task_list_id = await TaskManager.get_default_task_list(client, access_token)
+            UserCache.set_task_list_id(user_id, task_list_id)
+        return task_list_id
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+    @staticmethod
+    async def create_tasks(client: httpx.AsyncClient, user_id: str, access_token: str,
+                           tasks: List[TaskCreate]) -> List[dict]:
+        """Creates all tasks in the user's default list concurrently over the shared connection pool."""
+        for attempt in range(2):
+            task_list_id = await TaskManager.get_cached_task_list(client, user_id, access_token)
+            try:
+                return await asyncio.gather(*[
+                    TaskManager.create_task(client, access_token, task_list_id, task.title, task.due_date)
+                    for task in tasks
+                ])
+            except HTTPException as e:
+                # The cached list may have been deleted on Google's side, look it up again once
+                if e.status_code != 404 or attempt:
+                    raise
+                UserCache.invalidate_task_list(user_id)
+
+
+LEGACY_DAY_CONTENT_COLUMNS = [f'day_{day_number}_{kind}' for day_number in range(1, 8) for kind in ("flashcards", "quiz")]
+
+
+def legacy_day_content_columns() -> List[str]:
+    existing_columns = {column['name'] for column in inspect(Database.engine()).get_columns('courses')}
+    return [column for column in LEGACY_DAY_CONTENT_COLUMNS if column in existing_columns]
+
+
+def migrate_day_content_columns():
+    """Copies content from the legacy courses.day_N_flashcards/day_N_quiz columns into course_day_content.
+
+    The columns are kept so a rolled back deploy still finds its data; drop_legacy_day_content_columns
+    removes them once the new table is confirmed.
+    """
+    with Database.engine().begin() as connection:
+        for column in legacy_day_content_columns():
+            _, day_number, kind = column.split('_')
+            connection.execute(text(
+                f"INSERT INTO course_day_content (course_id, day_number, kind, content, created_at, updated_at) "
+                f"SELECT id, :day_number, :kind, {column}, :now, :now FROM courses WHERE {column} IS NOT NULL "
+                f"AND NOT EXISTS (SELECT 1 FROM course_day_content c WHERE c.course_id = courses.id "
+                f"AND c.day_number = :day_number AND c.kind = :kind)"
+            ), {'day_number': int(day_number), 'kind': kind, 'now': datetime.utcnow()})
+
+
+def drop_legacy_day_content_columns() -> List[str]:
+    """Drops the legacy day content columns, refusing while any of their content is missing from course_day_content."""
+    with Database.migration_lock():
+        migrate_day_content_columns()
+        columns = legacy_day_content_columns()
+
+        with Database.engine().begin() as connection:
+            for column in columns:
+                _, day_number, kind = column.split('_')
+                missing = connection.execute(text(
+                    f"SELECT COUNT(*) FROM courses WHERE {column} IS NOT NULL "
+                    f"AND NOT EXISTS (SELECT 1 FROM course_day_content c WHERE c.course_id = courses.id "
+                    f"AND c.day_number = :day_number AND c.kind = :kind)"
+                ), {'day_number': int(day_number), 'kind': kind}).scalar()
+                if missing:
+                    raise RuntimeError(f"{missing} courses still have {column} content missing from course_day_content")
+
+            for column in columns:
+                connection.execute(text(f"ALTER TABLE courses DROP COLUMN {column}"))
+
+    return columns
+
+
+def migrate_day_content_hashes(batch_size: int = 500):
+    """Adds course_day_content.content_hash to existing tables and fills it in for rows written without one."""
+    existing_columns = {column['name'] for column in inspect(Database.engine()).get_columns('course_day_content')}
+    if 'content_hash' not in existing_columns:
+        with Database.engine().begin() as connection:
+            connection.execute(text("ALTER TABLE course_day_content ADD COLUMN content_hash VARCHAR(64)"))
+
+    while True:
+        with Database.engine().begin() as connection:
+            rows = connection.execute(
+                select(CourseDayContent.course_id, CourseDayContent.day_number, CourseDayContent.kind,
+                       CourseDayContent.content)
+                .where(CourseDayContent.content_hash.is_(None))
+                .limit(batch_size)
+            ).all()
+            for row in rows:
+                connection.execute(update(CourseDayContent).where(
+                    CourseDayContent.course_id == row.course_id,
+                    CourseDayContent.day_number == row.day_number,
+                    CourseDayContent.kind == row.kind
+                ).values(content_hash=DayContentManager.content_hash(row.content)))
+        if len(rows) < batch_size:
+            return
 
 
-# Pydantic Models
-class TaskCreate(BaseModel):
-    title: str
-    due_date: date
+def create_missing_indexes():
+    # create_all only creates indexes together with new tables
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=Database.engine(), checkfirst=True)
+
+
+def migrate_token_encoding():
+    """Turns google_tokens values written as json.dumps strings into JSONB objects."""
+    if Database.engine().dialect.name != 'postgresql':
+        return
+
+    with Database.engine().begin() as connection:
+        connection.execute(text(
+            "UPDATE user_tokens SET google_tokens = (google_tokens #>> '{}')::jsonb "
+            "WHERE jsonb_typeof(google_tokens) = 'string'"
+        ))
 
 
+
+# Pydantic Models
 class CourseCreate(BaseModel):
     topic: str
     description: str
 
 
+# HTTP Client Dependency
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.http_client
+
+
 # Database Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with Database.session() as db:
         yield db
-    finally:
-        db.close()
 
 
 # User Management
 class UserManager:
     @staticmethod
-    async def create_or_update_user(db: Session, user_data: dict) -> Users:
-        user = db.query(Users).filter(Users.id == user_data['id']).first()
+    async def create_or_update_user(db: AsyncSession, user_data: dict) -> Users:
+        user = await db.get(Users, user_data['id'])
 
         if user:
             for key, value in user_data.items():
@@ -190,68 +647,79 @@ class UserManager:
             user = Users(**user_data)
             db.add(user)
 
-        db.commit()
-        db.refresh(user)
+        await db.commit()
         return user
 
 
 # Token Management
 class TokenManager:
     @staticmethod
-    async def store_tokens(db: Session, user_id: str, tokens: dict):
-        db_tokens = db.query(UserTokens).filter(UserTokens.user_id == user_id).first()
+    async def store_tokens(db: AsyncSession, user_id: str, tokens: dict):
+        db_tokens = await db.get(UserTokens, user_id)
 
         if db_tokens:
-            db_tokens.google_tokens = json.dumps(tokens)
+            db_tokens.google_tokens = tokens
             db_tokens.updated_at = datetime.utcnow()
         else:
             db_tokens = UserTokens(
                 user_id=user_id,
-                google_tokens=json.dumps(tokens)
+                google_tokens=tokens
             )
             db.add(db_tokens)
 
-        db.commit()
+        await db.commit()
+        UserCache.set_tokens(user_id, tokens)
 
     @staticmethod
-    async def get_valid_tokens(db: Session, user_id: str) -> Optional[dict]:
-        db_tokens = db.query(UserTokens).filter(UserTokens.user_id == user_id).first()
+    async def load_tokens(db: AsyncSession, user_id: str) -> Optional[dict]:
+        db_tokens = await db.get(UserTokens, user_id)
 
         if not db_tokens:
             return None
 
-        tokens = json.loads(db_tokens.google_tokens)
-        expires_at = datetime.fromisoformat(tokens['expires_at'])
+        tokens = db_tokens.google_tokens
+        # Rows written before google_tokens held native JSON
+        if isinstance(tokens, str):
+            tokens = json.loads(tokens)
+        UserCache.set_tokens(user_id, tokens)
+        return tokens
 
-        if expires_at <= datetime.utcnow() + timedelta(minutes=5):
-            try:
-                new_tokens = await TokenManager._refresh_token(tokens['refresh_token'])
-                tokens.update({
-                    'access_token': new_tokens['access_token'],
-                    'expires_at': (datetime.utcnow() +
-                                   timedelta(seconds=new_tokens['expires_in'])).isoformat()
-                })
-                await TokenManager.store_tokens(db, user_id, tokens)
-            except Exception as e:
+    @staticmethod
+    async def get_valid_tokens(db: AsyncSession, user_id: str, client: httpx.AsyncClient) -> Optional[dict]:
+        tokens = UserCache.get_tokens(user_id)
+
+        if tokens is None:
+            tokens = await TokenManager.load_tokens(db, user_id)
+
+            if not tokens:
                 return None
 
+        expires_at = datetime.fromisoformat(tokens['expires_at'])
+        TokenRefresher.track(user_id, expires_at, client)
+
+        if expires_at <= datetime.utcnow():
+            # Only an already expired token makes the request wait, and then on the shared refresh
+            return await TokenRefresher.refresh(user_id, tokens['refresh_token'], client)
+
+        if expires_at <= datetime.utcnow() + TOKEN_REFRESH_MARGIN:
+            TokenRefresher.refresh(user_id, tokens['refresh_token'], client)
+
         return tokens
 
     @staticmethod
-    async def _refresh_token(refresh_token: str) -> dict:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                'https://oauth2.googleapis.com/token',
-                data={
-                    'client_id': GOOGLE_CLIENT_ID,
-                    'client_secret': GOOGLE_CLIENT_SECRET,
-                    'refresh_token': refresh_token,
-                    'grant_type': 'refresh_token',
-                }
-            )
-            if response.status_code != 200:
-                raise HTTPException(status_code=401, detail="Token refresh failed")
-            return response.json()
+    async def _refresh_token(client: httpx.AsyncClient, refresh_token: str) -> dict:
+        response = await client.post(
+            'https://oauth2.googleapis.com/token',
+            data={
+                'client_id': Settings.GOOGLE_CLIENT_ID,
+                'client_secret': Settings.GOOGLE_CLIENT_SECRET,
+                'refresh_token': refresh_token,
+                'grant_type': 'refresh_token',
+            }
+        )
+        if response.status_code != 200:
+            raise HTTPException(status_code=401, detail="Token refresh failed")
+        return response.json()
 
     @staticmethod
     def create_access_token(user_id: str) -> str:
@@ -261,70 +729,689 @@ class TokenManager:
                 'user_id': user_id,
                 'exp': expiration
             },
-            JWT_SECRET,
-            algorithm=JWT_ALGORITHM
+            Settings.JWT_SECRET,
+            algorithm=Settings.JWT_ALGORITHM
         )
 
     @staticmethod
-    async def revoke_tokens(db: Session, user_id: str):
-        db.query(UserTokens).filter(UserTokens.user_id == user_id).delete()
-        db.commit()
+    async def revoke_tokens(db: AsyncSession, user_id: str):
+        await db.execute(delete(UserTokens).where(UserTokens.user_id == user_id))
+        await db.commit()
+        UserCache.invalidate(user_id)
+        TokenRefresher.forget(user_id)
+
+
+class TokenRefresher:
+    """Single-flights Google token refreshes per user and refreshes active users ahead of expiry."""
+    _in_flight: Dict[str, asyncio.Task] = {}
+    # user_id -> (last request time, access token expiry)
+    _active: Dict[str, tuple] = {}
+    _client: Optional[httpx.AsyncClient] = None
+    _scheduler: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def refresh(user_id: str, refresh_token: str, client: httpx.AsyncClient) -> asyncio.Future:
+        task = TokenRefresher._in_flight.get(user_id)
+        if task is None:
+            task = asyncio.create_task(TokenRefresher._refresh(user_id, refresh_token, client))
+            TokenRefresher._in_flight[user_id] = task
+            task.add_done_callback(lambda _: TokenRefresher._in_flight.pop(user_id, None))
+
+        # A waiter going away must not cancel the refresh for everyone else
+        return asyncio.shield(task)
+
+    @staticmethod
+    async def _refresh(user_id: str, refresh_token: str, client: httpx.AsyncClient) -> Optional[dict]:
+        try:
+            new_tokens = await TokenManager._refresh_token(client, refresh_token)
+            expires_at = datetime.utcnow() + timedelta(seconds=new_tokens['expires_in'])
+
+            async with Database.session() as db:
+                tokens = await TokenManager.load_tokens(db, user_id)
+                # The user logged out while the refresh was running
+                if not tokens:
+                    return None
+
+                tokens = {
+                    **tokens,
+                    'access_token': new_tokens['access_token'],
+                    'refresh_token': new_tokens.get('refresh_token', refresh_token),
+                    'expires_at': expires_at.isoformat()
+                }
+                await TokenManager.store_tokens(db, user_id, tokens)
+
+            if user_id in TokenRefresher._active:
+                TokenRefresher._active[user_id] = (TokenRefresher._active[user_id][0], expires_at)
+            return tokens
+        except Exception as e:
+            print(f"Error in refreshing tokens: {e}")
+            return None
+
+    @staticmethod
+    def track(user_id: str, expires_at: datetime, client: httpx.AsyncClient):
+        TokenRefresher._active[user_id] = (datetime.utcnow(), expires_at)
+        TokenRefresher._client = client
+
+        if TokenRefresher._scheduler is None or TokenRefresher._scheduler.done():
+            TokenRefresher._scheduler = asyncio.create_task(TokenRefresher._schedule())
+
+    @staticmethod
+    def forget(user_id: str):
+        TokenRefresher._active.pop(user_id, None)
+
+    @staticmethod
+    async def stop():
+        if TokenRefresher._scheduler is not None:
+            TokenRefresher._scheduler.cancel()
+            try:
+                await TokenRefresher._scheduler
+            except asyncio.CancelledError:
+                pass
+            TokenRefresher._scheduler = None
+
+    @staticmethod
+    async def _schedule():
+        while True:
+            await asyncio.sleep(TOKEN_REFRESH_INTERVAL)
+            now = datetime.utcnow()
+
+            for user_id, (last_used, expires_at) in list(TokenRefresher._active.items()):
+                if last_used <= now - TOKEN_REFRESH_IDLE:
+                    TokenRefresher._active.pop(user_id, None)
+                    continue
+
+                if expires_at > now + TOKEN_REFRESH_MARGIN or user_id in TokenRefresher._in_flight:
+                    continue
+
+                tokens = UserCache.get_tokens(user_id)
+                if tokens is None:
+                    async with Database.session() as db:
+                        tokens = await TokenManager.load_tokens(db, user_id)
+                    if not tokens:
+                        TokenRefresher._active.pop(user_id, None)
+                        continue
+
+                TokenRefresher.refresh(user_id, tokens['refresh_token'], TokenRefresher._client)
 
 
 # Course Management
-async def generate_day_materials(db: Session, course_id: str, day_number: int):
-    try:
-        course = db.query(Courses).filter(Courses.id == course_id).first()
+class CourseManager:
+    @staticmethod
+    async def get_user_course(db: AsyncSession, user_id: str, course_id: str, *columns):
+        """Fetches only the given columns of a course the user owns, or raises a 404."""
+        course = (await db.execute(select(*(columns or (Courses.id,))).where(
+            Courses.id == course_id,
+            Courses.user_id == user_id
+        ))).first()
+
         if not course:
-            return
+            raise HTTPException(
+                status_code=404,
+                detail="Course not found or not authorized to access this course"
+            )
+
+        return course
+
+    @staticmethod
+    async def count_user_courses(db: AsyncSession, user_id: str) -> int:
+        return await db.scalar(select(func.count(Courses.id)).where(Courses.user_id == user_id))
+
+
+# Day Content Management
+class DayContentManager:
+    # Hash of the {} stored for a kind whose generation failed, such rows don't count as content
+    EMPTY_HASH = hashlib.sha256(orjson.dumps({})).hexdigest()
+
+    @staticmethod
+    def content_hash(content) -> str:
+        return hashlib.sha256(orjson.dumps(content, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+    @staticmethod
+    def day_digest(hashes: Dict[str, Optional[str]]) -> Optional[str]:
+        """Identifies a day's flashcards and quiz together, or None unless both are stored with a hash."""
+        if not hashes.get("flashcards") or not hashes.get("quiz"):
+            return None
+        return hashlib.sha256(f"{hashes['flashcards']}:{hashes['quiz']}".encode()).hexdigest()
+
+    @staticmethod
+    async def get_day_hashes(db: AsyncSession, course_id: str, day_number: int) -> Dict[str, Optional[str]]:
+        rows = (await db.execute(select(CourseDayContent.kind, CourseDayContent.content_hash).where(
+            CourseDayContent.course_id == course_id,
+            CourseDayContent.day_number == day_number
+        ))).all()
+        return {row.kind: row.content_hash for row in rows}
+
+    @staticmethod
+    async def get_day_content(db: AsyncSession, course_id: str, day_number: int) -> dict:
+        rows = (await db.execute(select(CourseDayContent.kind, CourseDayContent.content).where(
+            CourseDayContent.course_id == course_id,
+            CourseDayContent.day_number == day_number
+        ))).all()
+        return {row.kind: row.content for row in rows}
+
+    @staticmethod
+    async def has_day_content(db: AsyncSession, course_id: str, day_number: int) -> bool:
+        return await db.scalar(select(func.count()).select_from(CourseDayContent).where(
+            CourseDayContent.course_id == course_id,
+            CourseDayContent.day_number == day_number,
+            CourseDayContent.content_hash != DayContentManager.EMPTY_HASH
+        )) == 2
+
+    @staticmethod
+    async def ready_days(db: AsyncSession, course_id: str) -> set:
+        rows = (await db.execute(select(CourseDayContent.day_number, CourseDayContent.kind).where(
+            CourseDayContent.course_id == course_id,
+            CourseDayContent.content_hash != DayContentManager.EMPTY_HASH
+        ))).all()
+        kinds: Dict[int, set] = {}
+        for row in rows:
+            kinds.setdefault(row.day_number, set()).add(row.kind)
+        return {day_number for day_number, day_kinds in kinds.items() if day_kinds == {"flashcards", "quiz"}}
+
+    @staticmethod
+    async def store_day_content(db: AsyncSession, course_id: str, day_number: int, content: dict):
+        """Upserts each kind in content ({"flashcards": ..., "quiz": ...}) and commits once."""
+        try:
+            await DayContentManager._upsert_day_content(db, course_id, day_number, content)
+        except IntegrityError:
+            # Another worker inserted the same rows in the meantime, update them instead
+            await db.rollback()
+            await DayContentManager._upsert_day_content(db, course_id, day_number, content)
+
+    @staticmethod
+    async def _upsert_day_content(db: AsyncSession, course_id: str, day_number: int, content: dict):
+        existing = {
+            row.kind: row for row in (await db.scalars(select(CourseDayContent).where(
+                CourseDayContent.course_id == course_id,
+                CourseDayContent.day_number == day_number,
+                CourseDayContent.kind.in_(list(content))
+            ))).all()
+        }
+
+        for kind, value in content.items():
+            if kind in existing:
+                existing[kind].content = value
+                existing[kind].content_hash = DayContentManager.content_hash(value)
+                existing[kind].updated_at = datetime.utcnow()
+            else:
+                db.add(CourseDayContent(course_id=course_id, day_number=day_number, kind=kind, content=value,
+                                        content_hash=DayContentManager.content_hash(value)))
+
+        await db.commit()
+
+    @staticmethod
+    async def store_many(db: AsyncSession, contents: Dict[tuple, dict]) -> int:
+        """Stores the kinds that are still missing (or empty) for many (course_id, day_number) pairs and commits once.
+
+        Content stored in the meantime, e.g. generated live while a batch ran, may already have been shown
+        to the user, so it is never overwritten. Returns how many rows were stored.
+        """
+        course_ids = {course_id for course_id, _ in contents}
+        for attempt in range(2):
+            existing = {
+                (row.course_id, row.day_number, row.kind): row for row in (await db.scalars(
+                    select(CourseDayContent).where(CourseDayContent.course_id.in_(course_ids))
+                )).all()
+            }
+
+            stored = 0
+            for (course_id, day_number), content in contents.items():
+                for kind, value in content.items():
+                    row = existing.get((course_id, day_number, kind))
+                    if row is None:
+                        db.add(CourseDayContent(course_id=course_id, day_number=day_number, kind=kind, content=value,
+                                                content_hash=DayContentManager.content_hash(value)))
+                    elif row.content_hash == DayContentManager.EMPTY_HASH:
+                        row.content = value
+                        row.content_hash = DayContentManager.content_hash(value)
+                        row.updated_at = datetime.utcnow()
+                    else:
+                        continue
+                    stored += 1
+
+            try:
+                await db.commit()
+                return stored
+            except IntegrityError:
+                # A live generation stored one of the days in the meantime, look again
+                await db.rollback()
+                if attempt:
+                    raise
+
+
+# Day Content Generation
+async def generate_day_content(db: AsyncSession, course, day_number: int) -> dict:
+    Config.COMPLETION_METRICS.label_course(course.id)
+    day_schedule = course.schedule[f'day_{day_number}']
+    subtopic = day_schedule['subtopic']
+
+    # Generate flashcards and a medium difficulty quiz for the day's subtopic concurrently
+    content = await Completions.return_day_content_async(subtopic, difficulty=2)
+
+    # Nothing is stored for a failed generation, so the next request tries again
+    if not content.get('flashcards') or not content.get('quiz'):
+        raise ValueError(f"Generation produced no content for day {day_number}")
 
-        day_schedule = course.schedule[f'day_{day_number}']
-        subtopic = day_schedule['subtopic']
+    # Store the generated materials in a single commit
+    content = {"flashcards": content['flashcards'], "quiz": content['quiz']}
+    await DayContentManager.store_day_content(db, course.id, day_number, content)
 
-        # Generate flashcards for the day's subtopic
-        flashcards = Completions.return_flashcards(subtopic)
-        # Generate quiz for the day's subtopic (medium difficulty)
-        quiz = Completions.return_quiz(subtopic, difficulty=2)
+    return content
 
-        # Update the course with the generated materials
-        setattr(course, f'day_{day_number}_flashcards', flashcards)
-        setattr(course, f'day_{day_number}_quiz', quiz)
 
-        db.commit()
+class GenerationCoordinator:
+    # In-flight generations in this process, keyed on (course_id, day_number)
+    _in_flight: Dict[tuple, asyncio.Task] = {}
+
+    @staticmethod
+    def start(course_id: str, day_number: int, queue: Optional[asyncio.Queue] = None) -> tuple:
+        """Returns (task, started) for the day's in-flight generation, starting one if there is none.
+
+        A generation started with a queue streams its completions and puts an SSE message on the queue for
+        each item, then None once it is done. Joining an existing generation never streams to the queue.
+        """
+        key = (course_id, day_number)
+        task = GenerationCoordinator._in_flight.get(key)
+        if task is not None:
+            return task, False
+
+        task = asyncio.create_task(GenerationCoordinator._generate(course_id, day_number, queue))
+        GenerationCoordinator._in_flight[key] = task
+        task.add_done_callback(lambda _: GenerationCoordinator._in_flight.pop(key, None))
+        return task, True
+
+    @staticmethod
+    async def get_or_generate(course_id: str, day_number: int) -> dict:
+        task, _ = GenerationCoordinator.start(course_id, day_number)
+        # Shield so one caller disconnecting doesn't cancel the generation for everyone else
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def in_flight(course_id: str, day_number: int) -> bool:
+        return (course_id, day_number) in GenerationCoordinator._in_flight
+
+    @staticmethod
+    async def stop():
+        # Cancelled generations still release their claims, so other workers can pick the days up
+        tasks = list(GenerationCoordinator._in_flight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @staticmethod
+    async def _stored_content(db: AsyncSession, course_id: str, day_number: int) -> Optional[dict]:
+        # End the current transaction so commits made by other workers are visible
+        await db.rollback()
+        content = await DayContentManager.get_day_content(db, course_id, day_number)
+
+        if content.get("flashcards") and content.get("quiz"):
+            return content
+        return None
+
+    @staticmethod
+    async def _try_claim(db: AsyncSession, course_id: str, day_number: int) -> bool:
+        try:
+            db.add(CourseDayClaims(course_id=course_id, day_number=day_number))
+            await db.commit()
+            return True
+        except IntegrityError:
+            await db.rollback()
+
+        # Take over claims left behind by a worker that died mid-generation
+        stale = await db.execute(update(CourseDayClaims).where(
+            CourseDayClaims.course_id == course_id,
+            CourseDayClaims.day_number == day_number,
+            CourseDayClaims.claimed_at < datetime.utcnow() - GENERATION_CLAIM_TIMEOUT
+        ).values(claimed_at=datetime.utcnow()))
+        await db.commit()
+
+        return stale.rowcount == 1
+
+    @staticmethod
+    async def _release_claim(db: AsyncSession, course_id: str, day_number: int):
+        await db.rollback()
+        await db.execute(delete(CourseDayClaims).where(
+            CourseDayClaims.course_id == course_id,
+            CourseDayClaims.day_number == day_number
+        ))
+        await db.commit()
+
+    @staticmethod
+    async def _generate(course_id: str, day_number: int, queue: Optional[asyncio.Queue] = None) -> dict:
+        try:
+            async with Database.session() as db:
+                while not await GenerationCoordinator._try_claim(db, course_id, day_number):
+                    # Another worker is generating this day, wait for its result
+                    await asyncio.sleep(GENERATION_POLL_INTERVAL)
+                    content = await GenerationCoordinator._stored_content(db, course_id, day_number)
+                    if content:
+                        return content
+
+                try:
+                    content = await GenerationCoordinator._stored_content(db, course_id, day_number)
+                    if content:
+                        return content
+
+                    course = (await db.execute(
+                        select(Courses.id, Courses.schedule).where(Courses.id == course_id)
+                    )).first()
+                    if not course:
+                        raise ValueError(f"Course {course_id} not found")
+                    # Whole weeks generate seven days at once, none of them should hold a connection while waiting on the model
+                    await db.rollback()
+
+                    if queue is not None:
+                        return await generate_streamed_day_content(db, course, day_number, queue)
+                    return await generate_day_content(db, course, day_number)
+                finally:
+                    await GenerationCoordinator._release_claim(db, course_id, day_number)
+        finally:
+            if queue is not None:
+                queue.put_nowait(None)
+
+
+async def generate_day_materials(course_id: str, day_number: int) -> bool:
+    Config.COMPLETION_METRICS.start_request("pregeneration")
+    try:
+        await GenerationCoordinator.get_or_generate(course_id, day_number)
+        return True
     except Exception as e:
         print(f"Error generating materials for day {day_number}: {str(e)}")
-        db.rollback()
+        return False
 
 
-# Authentication Dependency
-async def get_current_user(authorization: str = Header(...)) -> str:
-    try:
-        token = authorization.replace('Bearer ', '')
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+class PregenerationQueue:
+    # Lower priority values are generated first
+    _queue: Optional[asyncio.PriorityQueue] = None
+    _workers: List[asyncio.Task] = []
+    _status: Dict[tuple, str] = {}
+    _counter = 0
+
+    @staticmethod
+    def _ensure_workers():
+        if PregenerationQueue._queue is None:
+            PregenerationQueue._queue = asyncio.PriorityQueue()
+
+        PregenerationQueue._workers = [worker for worker in PregenerationQueue._workers if not worker.done()]
+        while len(PregenerationQueue._workers) < Settings.PREGENERATION_WORKERS:
+            PregenerationQueue._workers.append(asyncio.create_task(PregenerationQueue._worker()))
+
+    @staticmethod
+    def enqueue(course_id: str, day_number: int, priority: int):
+        key = (course_id, day_number)
+        if PregenerationQueue._status.get(key) == "running":
+            return
+
+        PregenerationQueue._ensure_workers()
+        PregenerationQueue._status[key] = "queued"
+        # The counter keeps equal priorities in FIFO order
+        PregenerationQueue._counter += 1
+        PregenerationQueue._queue.put_nowait((priority, PregenerationQueue._counter, course_id, day_number))
+
+    @staticmethod
+    def status(course_id: str, day_number: int) -> Optional[str]:
+        return PregenerationQueue._status.get((course_id, day_number))
+
+    @staticmethod
+    async def stop():
+        for worker in PregenerationQueue._workers:
+            worker.cancel()
+        await asyncio.gather(*PregenerationQueue._workers, return_exceptions=True)
+        PregenerationQueue._workers = []
+        # The queue belongs to the event loop that is shutting down
+        PregenerationQueue._queue = None
+        PregenerationQueue._status.clear()
+
+    @staticmethod
+    async def _worker():
+        while True:
+            _, _, course_id, day_number = await PregenerationQueue._queue.get()
+            key = (course_id, day_number)
+            try:
+                # Skip duplicates left behind when a job was re-enqueued with a higher priority
+                if PregenerationQueue._status.get(key) != "queued":
+                    continue
+
+                PregenerationQueue._status[key] = "running"
+                if await generate_day_materials(course_id, day_number):
+                    # Finished content is reported from the database, no need to keep it here
+                    PregenerationQueue._status.pop(key, None)
+                else:
+                    PregenerationQueue._status[key] = "failed"
+            finally:
+                PregenerationQueue._queue.task_done()
+
+
+async def generate_materials_batch(course_ids: Optional[List[str]] = None) -> dict:
+    """Generates every missing day of the given (or all) courses through one Batch API job and stores the results."""
+    generator = BatchGenerator.from_config()
+
+    async with Database.session() as db:
+        query = select(Courses.id, Courses.schedule)
+        if course_ids:
+            query = query.where(Courses.id.in_(course_ids))
+        courses = (await db.execute(query)).all()
+
+        requests = []
+        for course in courses:
+            missing_days = sorted(set(range(1, 8)) - await DayContentManager.ready_days(db, course.id))
+            if missing_days and course.schedule:
+                requests += BatchGenerator.day_requests(course.id, course.schedule, missing_days)
+
+    if not requests:
+        return {"batch_id": None, "requests": 0, "stored": 0, "failed": []}
+
+    # No connection is held while the batch runs, which can take hours
+    batch_id = await generator.submit(requests)
+    batch = await generator.wait(batch_id, Config.BATCH_POLL_INTERVAL_SECONDS)
+    contents, failed = await generator.results(batch)
+
+    stored = 0
+    if contents:
+        async with Database.session() as db:
+            stored = await DayContentManager.store_many(db, contents)
+
+    return {
+        "batch_id": batch_id,
+        "status": batch["status"],
+        "requests": len(requests),
+        # Days generated live while the batch ran keep their content
+        "stored": stored,
+        # Failed or short entries are generated live the first time the day is opened
+        "failed": failed
+    }
+
+
+# Google Sign-In
+class GoogleOAuth:
+    _flow: Optional[Flow] = None
+    _certs: Optional[Dict[str, str]] = None
+    _certs_expire_at = 0.0
+    _certs_fetched_at = 0.0
+    _certs_lock: Optional[asyncio.Lock] = None
+
+    @staticmethod
+    def flow() -> Flow:
+        # Only builds authorization URLs, which never leaves the event loop, so one instance is enough
+        if GoogleOAuth._flow is None:
+            client_config = {
+                "web": {
+                    "client_id": Settings.GOOGLE_CLIENT_ID,
+                    "client_secret": Settings.GOOGLE_CLIENT_SECRET,
+                    "auth_uri": GOOGLE_AUTH_URI,
+                    "token_uri": GOOGLE_TOKEN_URI,
+                    "redirect_uris": [Settings.REDIRECT_URI],
+                }
+            }
+            GoogleOAuth._flow = Flow.from_client_config(client_config, scopes=SCOPES, redirect_uri=Settings.REDIRECT_URI)
+        return GoogleOAuth._flow
+
+    @staticmethod
+    async def exchange_code(client: httpx.AsyncClient, code: str) -> dict:
+        response = await client.post(
+            GOOGLE_TOKEN_URI,
+            data={
+                'code': code,
+                'client_id': Settings.GOOGLE_CLIENT_ID,
+                'client_secret': Settings.GOOGLE_CLIENT_SECRET,
+                'redirect_uri': Settings.REDIRECT_URI,
+                'grant_type': 'authorization_code',
+            }
+        )
+        if response.status_code != 200:
+            raise HTTPException(status_code=401, detail="Failed to exchange authorization code")
+        return response.json()
+
+    @staticmethod
+    async def get_certs(client: httpx.AsyncClient, force: bool = False) -> Dict[str, str]:
+        if GoogleOAuth._certs_lock is None:
+            GoogleOAuth._certs_lock = asyncio.Lock()
+
+        async with GoogleOAuth._certs_lock:
+            now = time.time()
+            stale = force and GoogleOAuth._certs_fetched_at <= now - GOOGLE_CERTS_MIN_REFRESH
+            if stale or GoogleOAuth._certs is None or GoogleOAuth._certs_expire_at <= now:
+                response = await client.get(GOOGLE_CERTS_URL)
+                if response.status_code != 200:
+                    raise HTTPException(status_code=503, detail="Failed to fetch Google certificates")
+
+                max_age = re.search(r'max-age=(\d+)', response.headers.get('cache-control', ''))
+                GoogleOAuth._certs = response.json()
+                GoogleOAuth._certs_fetched_at = now
+                GoogleOAuth._certs_expire_at = now + (int(max_age.group(1)) if max_age else GOOGLE_CERTS_DEFAULT_TTL)
+
+            return GoogleOAuth._certs
+
+    @staticmethod
+    async def verify_id_token(client: httpx.AsyncClient, token: str) -> dict:
+        certs = await GoogleOAuth.get_certs(client)
+        try:
+            # Google rotates its keys, a key id we have not seen yet means our copy is stale
+            if google_jwt.decode_header(token).get('kid') not in certs:
+                certs = await GoogleOAuth.get_certs(client, force=True)
+
+            id_info = google_jwt.decode(token, certs=certs, audience=Settings.GOOGLE_CLIENT_ID, clock_skew_in_seconds=10)
+        except ValueError:
+            raise HTTPException(status_code=401, detail="Invalid ID token")
+
+        if id_info['iss'] not in GOOGLE_ISSUERS:
+            raise HTTPException(status_code=401, detail="Invalid ID token issuer")
+        return id_info
+
+
+# Access Token Verification
+class AccessTokens:
+    """Verifies our JWTs, remembering decoded tokens until they expire and tokens revoked on logout."""
+    # token -> (user_id, exp)
+    _decoded_cache: Optional[TLRUCache] = None
+    # Hashes of unexpired revoked tokens, a copy of revoked_tokens refreshed every JWT_REVOCATION_REFRESH_SECONDS
+    _revoked: set = set()
+    _revoked_loaded_at: Optional[float] = None
+    _revoked_lock: Optional[asyncio.Lock] = None
+
+    @staticmethod
+    def _decoded() -> TLRUCache:
+        if AccessTokens._decoded_cache is None:
+            AccessTokens._decoded_cache = TLRUCache(maxsize=Settings.JWT_CACHE_SIZE, ttu=lambda _, value, now: value[1], timer=time.time)
+        return AccessTokens._decoded_cache
+
+    @staticmethod
+    def _hash(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @staticmethod
+    def _lock() -> asyncio.Lock:
+        if AccessTokens._revoked_lock is None:
+            AccessTokens._revoked_lock = asyncio.Lock()
+        return AccessTokens._revoked_lock
+
+    @staticmethod
+    async def load_revoked():
+        """Reloads the revoked tokens from the database once the in-memory copy is older than the refresh interval."""
+        def fresh() -> bool:
+            loaded_at = AccessTokens._revoked_loaded_at
+            return loaded_at is not None and loaded_at > time.monotonic() - Settings.JWT_REVOCATION_REFRESH_SECONDS
+
+        if fresh():
+            return
+
+        async with AccessTokens._lock():
+            if fresh():
+                return
+            try:
+                async with Database.session() as db:
+                    AccessTokens._revoked = set((await db.scalars(select(RevokedTokens.token_hash).where(
+                        RevokedTokens.expires_at > datetime.utcnow()
+                    ))).all())
+            except Exception as e:
+                print(f"Error loading revoked tokens: {e}")
+            # Also after a failure, so a database outage is not retried on every request
+            AccessTokens._revoked_loaded_at = time.monotonic()
+
+    @staticmethod
+    def verify(token: str) -> str:
+        if AccessTokens._hash(token) in AccessTokens._revoked:
+            raise HTTPException(status_code=401, detail="Token has been revoked")
+
+        cached = AccessTokens._decoded().get(token)
+        if cached is not None:
+            return cached[0]
+
+        try:
+            payload = jwt.decode(token, Settings.JWT_VERIFY_KEY, algorithms=[Settings.JWT_ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token has expired")
+        except jwt.PyJWTError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+        AccessTokens._decoded()[token] = (payload['user_id'], payload['exp'])
         return payload['user_id']
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+
+    @staticmethod
+    async def revoke(db: AsyncSession, token: str):
+        try:
+            AccessTokens.verify(token)
+        except HTTPException:
+            return
+        _, exp = AccessTokens._decoded()[token]
+        token_hash = AccessTokens._hash(token)
+
+        # Stored so every worker, and this one after a restart, rejects the token too
+        await db.execute(delete(RevokedTokens).where(RevokedTokens.expires_at <= datetime.utcnow()))
+        db.add(RevokedTokens(token_hash=token_hash, expires_at=datetime.utcfromtimestamp(exp)))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Already revoked by a concurrent logout with the same token
+            await db.rollback()
+
+        # Under the lock, so a reload that started before the commit cannot drop it again
+        async with AccessTokens._lock():
+            AccessTokens._decoded().pop(token, None)
+            AccessTokens._revoked.add(token_hash)
+
+
+def get_bearer_token(authorization: str = Header(...)) -> str:
+    return authorization.replace('Bearer ', '')
+
+
+def require_metrics_token(authorization: Optional[str] = Header(None)):
+    if not Settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest((authorization or "").encode(), f"Bearer {Settings.METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+
+
+# Authentication Dependency
+async def get_current_user(token: str = Depends(get_bearer_token)) -> str:
+    await AccessTokens.load_revoked()
+    return AccessTokens.verify(token)
 
 
 # Routes
-@app.get("/login")
+@router.get("/login")
 async def login():
-    flow = Flow.from_client_config(
-        {
-            "web": {
-                "client_id": GOOGLE_CLIENT_ID,
-                "client_secret": GOOGLE_CLIENT_SECRET,
-                "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                "token_uri": "https://oauth2.googleapis.com/token",
-                "redirect_uris": [REDIRECT_URI],
-            }
-        },
-        scopes=SCOPES
-    )
-    flow.redirect_uri = REDIRECT_URI
-    authorization_url, state = flow.authorization_url(
+    authorization_url, state = GoogleOAuth.flow().authorization_url(
         access_type='offline',
         include_granted_scopes='true',
         prompt='consent'
@@ -335,30 +1422,15 @@ async def login():
     })
 
 
-@app.get("/callback")
-async def callback(code: str, state: str, db: Session = Depends(get_db)):
-    flow = Flow.from_client_config(
-        {
-            "web": {
-                "client_id": GOOGLE_CLIENT_ID,
-                "client_secret": GOOGLE_CLIENT_SECRET,
-                "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                "token_uri": "https://oauth2.googleapis.com/token",
-                "redirect_uris": [REDIRECT_URI],
-            }
-        },
-        scopes=SCOPES
-    )
-    flow.redirect_uri = REDIRECT_URI
-    flow.fetch_token(code=code)
-
-    credentials = flow.credentials
-    id_info = id_token.verify_oauth2_token(
-        credentials.id_token,
-        requests.Request(),
-        GOOGLE_CLIENT_ID,
-        clock_skew_in_seconds=10
-    )
+@router.get("/callback")
+async def callback(
+    code: str,
+    state: str,
+    db: AsyncSession = Depends(get_db),
+    client: httpx.AsyncClient = Depends(get_http_client)
+):
+    credentials = await GoogleOAuth.exchange_code(client, code)
+    id_info = await GoogleOAuth.verify_id_token(client, credentials['id_token'])
 
     user_data = {
         'id': id_info['sub'],
@@ -371,24 +1443,22 @@ async def callback(code: str, state: str, db: Session = Depends(get_db)):
     await UserManager.create_or_update_user(db, user_data)
 
     tokens = {
-        'access_token': credentials.token,
-        'refresh_token': credentials.refresh_token,
-        'id_token': credentials.id_token,
-        'expires_at': (datetime.utcnow() +
-                       timedelta(seconds=credentials.expiry.timestamp() -
-                                         datetime.utcnow().timestamp())).isoformat()
+        'access_token': credentials['access_token'],
+        'refresh_token': credentials.get('refresh_token'),
+        'id_token': credentials['id_token'],
+        'expires_at': (datetime.utcnow() + timedelta(seconds=credentials['expires_in'])).isoformat()
     }
 
     await TokenManager.store_tokens(db, user_data['id'], tokens)
     jwt_token = TokenManager.create_access_token(user_data['id'])
 
-    redirect_url = f"{FRONTEND_URL}?token={jwt_token}"
+    redirect_url = f"{Settings.FRONTEND_URL}?token={jwt_token}"
     return RedirectResponse(url=redirect_url)
 
 
-@app.get("/profile")
-async def get_user_profile(user_id: str = Depends(get_current_user), db: Session = Depends(get_db)):
-    user = db.query(Users).filter(Users.id == user_id).first()
+@router.get("/profile")
+async def get_user_profile(user_id: str = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    user = await db.get(Users, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -402,13 +1472,15 @@ async def get_user_profile(user_id: str = Depends(get_current_user), db: Session
 
 
 # Course list endpoint
-@app.get("/tutor")
+@router.get("/tutor")
 async def tutor(
         user_id: str = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
     try:
-        courses = db.query(Courses).filter(Courses.user_id == user_id).all()
+        courses = (await db.execute(
+            select(Courses.id, Courses.topic, Courses.img_id).where(Courses.user_id == user_id)
+        )).all()
         if not courses:
             return JSONResponse({"courses": None})
 
@@ -424,30 +1496,35 @@ async def tutor(
 
 
 # Course creation endpoint
-@app.post("/new")
+@router.post("/new")
 async def create_course(
         course: CourseCreate,
         user_id: str = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
     # Check if user has reached course limit
-    user_courses = db.query(Courses).filter(Courses.user_id == user_id).all()
-    if len(user_courses) >= 3:
+    if await CourseManager.count_user_courses(db, user_id) >= 3:
         raise HTTPException(
             status_code=400,
             detail="Maximum number of courses (3) reached"
         )
 
+    # Release the connection while waiting on the model
+    await db.close()
+
+    course_id = str(uuid.uuid4())
+    Config.COMPLETION_METRICS.label_course(course_id)
+
     try:
         # Generate course schedule
-        schedule = Completions.return_week_schedule(course.topic, course.description)
+        schedule = await Completions.return_week_schedule_async(course.topic, course.description)
 
         # Generate random image ID between 1-99
         img_id = str(random.randint(1, 99)).zfill(2)
 
         # Create new course
         new_course = Courses(
-            id=str(uuid.uuid4()),
+            id=course_id,
             user_id=user_id,
             topic=course.topic,
             img_id=img_id,
@@ -455,8 +1532,13 @@ async def create_course(
         )
 
         db.add(new_course)
-        db.commit()
-        db.refresh(new_course)
+        await db.commit()
+
+        # Warm day 1 in the background, and optionally the rest of the week after it
+        PregenerationQueue.enqueue(new_course.id, 1, priority=NEXT_DAY_PRIORITY)
+        if Settings.PREGENERATE_ALL_DAYS:
+            for day_number in range(2, 8):
+                PregenerationQueue.enqueue(new_course.id, day_number, priority=WEEK_DAY_PRIORITY + day_number)
 
         return JSONResponse({
             "message": "Course created successfully",
@@ -467,21 +1549,105 @@ async def create_course(
             }
         })
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Encoded JSON responses
+class EncodedJSON:
+    """orjson serialization, gzip/brotli negotiation and strong ETags for large JSON payloads."""
+
+    _body_cache: Optional[LRUCache] = None
+
+    @staticmethod
+    def _bodies() -> LRUCache:
+        if EncodedJSON._body_cache is None:
+            EncodedJSON._body_cache = LRUCache(maxsize=Settings.RESPONSE_BODY_CACHE_SIZE)
+        return EncodedJSON._body_cache
+
+    @staticmethod
+    def preferred_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+        accepted = {}
+        for part in (accept_encoding or "").split(","):
+            name, _, params = part.partition(";")
+            quality = 1.0
+            match = re.search(r"q=([0-9.]+)", params)
+            if match:
+                quality = float(match.group(1))
+            accepted[name.strip().lower()] = quality
+
+        for encoding in ("br", "gzip"):
+            if encoding == "br" and brotli is None:
+                continue
+            if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+                return encoding
+        return None
+
+    @staticmethod
+    def etag(digest: str, encoding: Optional[str]) -> str:
+        # Each encoding is a different representation, so it gets its own strong validator
+        return f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+    @staticmethod
+    def matches(if_none_match: Optional[str], digest: str) -> bool:
+        for tag in (if_none_match or "").split(","):
+            tag = tag.strip().removeprefix("W/").strip('"')
+            if tag == "*" or tag.split("-")[0] == digest:
+                return True
+        return False
+
+    @staticmethod
+    def _headers(digest: Optional[str], encoding: Optional[str]) -> Dict[str, str]:
+        headers = {"Vary": "Accept-Encoding", "Cache-Control": "private, no-cache"}
+        if digest:
+            headers["ETag"] = EncodedJSON.etag(digest, encoding)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return headers
+
+    @staticmethod
+    def not_modified(digest: str, encoding: Optional[str]) -> Response:
+        return Response(status_code=304, headers=EncodedJSON._headers(digest, encoding))
+
+    @staticmethod
+    def cached(digest: str, encoding: Optional[str]) -> Optional[Response]:
+        entry = EncodedJSON._bodies().get((digest, encoding))
+        if entry is None:
+            return None
+        body, body_encoding = entry
+        return Response(body, media_type="application/json", headers=EncodedJSON._headers(digest, body_encoding))
+
+    @staticmethod
+    def response(content, encoding: Optional[str], digest: Optional[str] = None) -> Response:
+        body = orjson.dumps(content)
+        requested_encoding = encoding
+
+        # Small bodies gain little from compression
+        if len(body) < Settings.COMPRESSION_MIN_BYTES:
+            encoding = None
+        elif encoding == "br":
+            body = brotli.compress(body, quality=BROTLI_QUALITY)
+        elif encoding == "gzip":
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+        if digest:
+            EncodedJSON._bodies()[(digest, requested_encoding)] = (body, encoding)
+        return Response(body, media_type="application/json", headers=EncodedJSON._headers(digest, encoding))
+
+
 # Day content generation endpoint
 # Request body model_docs
 class DayContentRequest(BaseModel):
     course_id: str
     day_number: int
 
-@app.post("/generate-day-content")
+@router.post("/generate-day-content")
 async def get_or_generate_day_content(
     request: DayContentRequest,
     user_id: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None)
 ):
     # Validate day number
     if not 1 <= request.day_number <= 7:
@@ -490,96 +1656,293 @@ async def get_or_generate_day_content(
             detail="Day number must be between 1 and 7"
         )
 
-    # Get user's courses
-    user_courses = db.query(Courses).filter(Courses.user_id == user_id).all()
-    user_course_ids = [course.id for course in user_courses]
+    # Get the course if it belongs to the user
+    course = await CourseManager.get_user_course(db, user_id, request.course_id)
 
-    # Check if the course exists and belongs to the user
-    if request.course_id not in user_course_ids:
-        raise HTTPException(
-            status_code=404,
-            detail="Course not found or not authorized to access this course"
-        )
+    # Warm the next day in the background, it's the one the user is most likely to open next
+    if request.day_number < 7 and not await DayContentManager.has_day_content(db, course.id, request.day_number + 1):
+        PregenerationQueue.enqueue(course.id, request.day_number + 1, priority=NEXT_DAY_PRIORITY)
+
+    encoding = EncodedJSON.preferred_encoding(accept_encoding)
 
-    # Get the course
-    course = db.query(Courses).filter(Courses.id == request.course_id).first()
+    # Revalidations and repeat requests are answered from the stored hashes without loading the content
+    digest = DayContentManager.day_digest(await DayContentManager.get_day_hashes(db, course.id, request.day_number))
+    if digest:
+        if EncodedJSON.matches(if_none_match, digest):
+            return EncodedJSON.not_modified(digest, encoding)
+        cached = EncodedJSON.cached(digest, encoding)
+        if cached is not None:
+            return cached
 
     # Check if content already exists for this day
-    flashcards = getattr(course, f'day_{request.day_number}_flashcards')
-    quiz = getattr(course, f'day_{request.day_number}_quiz')
+    content = await DayContentManager.get_day_content(db, course.id, request.day_number)
+    flashcards = content.get("flashcards")
+    quiz = content.get("quiz")
 
     if flashcards and quiz:
         # Return existing content
-        return {
+        content = {
             "flashcards": flashcards,
             "quiz": quiz
         }
+        return EncodedJSON.response(content, encoding, digest or DayContentManager.day_digest(
+            {kind: DayContentManager.content_hash(value) for kind, value in content.items()}
+        ))
+
+    # Release the connection while waiting on the model
+    await db.close()
 
     try:
-        # Get the day's subtopic from schedule
-        day_schedule = course.schedule[f'day_{request.day_number}']
-        subtopic = day_schedule['subtopic']
+        # Generate new content, sharing any generation already in flight for this day
+        content = await GenerationCoordinator.get_or_generate(course.id, request.day_number)
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error generating content for day {request.day_number}: {str(e)}"
+        )
 
-        # Generate new content
-        flashcards = Completions.return_flashcards(subtopic)
-        quiz = Completions.return_quiz(subtopic, difficulty=2)
+    # Same digest the stored copy will have, so the next request can revalidate
+    digest = DayContentManager.day_digest(
+        {kind: DayContentManager.content_hash(value) for kind, value in content.items() if value}
+    )
+    return EncodedJSON.response(content, encoding, digest)
 
-        # Update the course with the generated materials
-        setattr(course, f'day_{request.day_number}_flashcards', flashcards)
-        setattr(course, f'day_{request.day_number}_quiz', quiz)
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-        db.commit()
 
-        return {
-            "flashcards": flashcards,
-            "quiz": quiz
-        }
+async def generate_streamed_day_content(db: AsyncSession, course, day_number: int, queue: asyncio.Queue) -> dict:
+    """Like generate_day_content, but streams both completions and puts an SSE message on queue for each item."""
+    Config.COMPLETION_METRICS.label_course(course.id)
+    subtopic = course.schedule[f'day_{day_number}']['subtopic']
+    content = {}
+
+    async def pump(name: str, item_event: str, stream: AsyncIterator):
+        async for kind, value in stream:
+            if kind == "item":
+                queue.put_nowait(format_sse(item_event, value))
+            else:
+                content[name] = value
+
+    await asyncio.gather(
+        pump("flashcards", "flashcard", Completions.stream_flashcards(subtopic)),
+        pump("quiz", "quiz_question", Completions.stream_quiz(subtopic, difficulty=2))
+    )
 
+    if not content.get("flashcards") or not content.get("quiz"):
+        raise ValueError(f"Streaming produced no content for day {day_number}")
+
+    # Persist the final objects once both streams have completed
+    content = {"flashcards": content["flashcards"], "quiz": content["quiz"]}
+    await DayContentManager.store_day_content(db, course.id, day_number, content)
+    return content
+
+
+async def stream_day_events(course_id: str, day_number: int) -> AsyncIterator[str]:
+    """Streams the day's generation, or replays its result if another request or worker is already generating it."""
+    queue: asyncio.Queue = asyncio.Queue()
+    task, started = GenerationCoordinator.start(course_id, day_number, queue)
+
+    streamed = 0
+    if started:
+        while (message := await queue.get()) is not None:
+            streamed += 1
+            yield message
+
+    try:
+        # The generation is shared, a client going away must not cancel it
+        content = await asyncio.shield(task)
     except Exception as e:
-        db.rollback()
+        print(f"Error streaming content for day {day_number}: {str(e)}")
+        yield format_sse("error", {"detail": f"Error generating content for day {day_number}"})
+        return
+
+    if streamed:
+        yield format_sse("done", content)
+    else:
+        async for message in stream_stored_day_events(content):
+            yield message
+
+
+async def stream_stored_day_events(content: dict) -> AsyncIterator[str]:
+    for flashcard in content["flashcards"].get("flashcard_pairs", []):
+        yield format_sse("flashcard", flashcard)
+    for question in content["quiz"].get("quiz_questions", []):
+        yield format_sse("quiz_question", question)
+    yield format_sse("done", content)
+
+
+@router.post("/stream-day-content")
+async def stream_day_content(
+    request: DayContentRequest,
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Validate day number
+    if not 1 <= request.day_number <= 7:
         raise HTTPException(
-            status_code=500,
-            detail=f"Error generating content for day {request.day_number}: {str(e)}"
+            status_code=400,
+            detail="Day number must be between 1 and 7"
         )
 
+    # Get the course if it belongs to the user
+    course = await CourseManager.get_user_course(db, user_id, request.course_id)
+
+    content = await DayContentManager.get_day_content(db, course.id, request.day_number)
+    flashcards = content.get("flashcards")
+    quiz = content.get("quiz")
+
+    # The stream outlives this request's session, so give its connection back now
+    await db.close()
+
+    if flashcards and quiz:
+        events = stream_stored_day_events({"flashcards": flashcards, "quiz": quiz})
+    else:
+        # Shares the claim and in-flight generation with /generate-day-content and pre-generation
+        events = stream_day_events(course.id, request.day_number)
+
+    return StreamingResponse(events, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 # Request body model for schedule
 class CourseScheduleRequest(BaseModel):
     course_id: str
 
-@app.post("/get-schedule")
+@router.post("/get-schedule")
 async def get_course_schedule(
     request: CourseScheduleRequest,
     user_id: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    # Get user's courses
-    user_courses = db.query(Courses).filter(Courses.user_id == user_id).all()
-    user_course_ids = [course.id for course in user_courses]
+    # Get the course if it belongs to the user
+    course = await CourseManager.get_user_course(db, user_id, request.course_id, Courses.topic, Courses.schedule)
 
-    # Check if the course exists and belongs to the user
-    if request.course_id not in user_course_ids:
-        raise HTTPException(
-            status_code=404,
-            detail="Course not found or not authorized to access this course"
+    return {
+        "topic": course.topic,
+        "schedule": course.schedule
+    }
+
+
+@router.post("/generation-status")
+async def get_generation_status(
+    request: CourseScheduleRequest,
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Get the course if it belongs to the user
+    course = await CourseManager.get_user_course(db, user_id, request.course_id)
+
+    ready_days = await DayContentManager.ready_days(db, course.id)
+
+    days = {}
+    for day_number in range(1, 8):
+        if day_number in ready_days:
+            days[f'day_{day_number}'] = "ready"
+        elif GenerationCoordinator.in_flight(course.id, day_number):
+            days[f'day_{day_number}'] = "running"
+        else:
+            days[f'day_{day_number}'] = PregenerationQueue.status(course.id, day_number) or "not_started"
+
+    return {"days": days}
+
+
+# Request body model for syncing a schedule to Google Tasks
+class ScheduleTasksRequest(BaseModel):
+    course_id: str
+    start_date: Optional[date] = None
+
+@router.post("/sync-schedule-tasks")
+async def sync_schedule_tasks(
+    request: ScheduleTasksRequest,
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    client: httpx.AsyncClient = Depends(get_http_client)
+):
+    # Get the course if it belongs to the user
+    course = await CourseManager.get_user_course(db, user_id, request.course_id, Courses.topic, Courses.schedule)
+
+    schedule = course.schedule or {}
+    subtopics = [schedule.get(f'day_{day_number}', {}).get('subtopic') for day_number in range(1, 8)]
+    if not all(subtopics):
+        raise HTTPException(status_code=409, detail="Course has no schedule")
+
+    tokens = await TokenManager.get_valid_tokens(db, user_id, client)
+    if not tokens:
+        raise HTTPException(status_code=401, detail="Google account is not connected")
+
+    # Nothing else needs the database, release the connection before calling Google
+    await db.close()
+
+    start_date = request.start_date or date.today()
+    tasks = [
+        TaskCreate(
+            title=f"{course.topic} - Day {day_number}: {subtopic}",
+            due_date=start_date + timedelta(days=day_number - 1)
         )
+        for day_number, subtopic in enumerate(subtopics, start=1)
+    ]
+
+    created = await TaskManager.create_tasks(client, user_id, tokens['access_token'], tasks)
 
-    # Get the course
-    course = db.query(Courses).filter(Courses.id == request.course_id).first()
+    return {"tasks": [{"id": task.get('id'), "title": task.get('title'), "due": task.get('due')} for task in created]}
+
+
+@router.get("/db-pool", dependencies=[Depends(require_metrics_token)])
+async def get_db_pool_status():
+    pool = Database.async_engine().pool
+    checkouts = InstrumentedPool.checkouts
 
     return {
-        "topic": course.topic,
-        "schedule": course.schedule
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "max_overflow": Settings.DB_MAX_OVERFLOW,
+        "checkouts": checkouts,
+        "avg_checkout_wait_ms": (InstrumentedPool.total_wait / checkouts * 1000) if checkouts else 0.0,
+        "max_checkout_wait_ms": InstrumentedPool.max_wait * 1000
     }
 
 
-@app.post("/logout")
+@router.get("/metrics", dependencies=[Depends(require_metrics_token)])
+async def get_metrics():
+    return PlainTextResponse(Config.COMPLETION_METRICS.render(cache_stats=CompletionFormat.cache_stats()),
+                             media_type="text/plain; version=0.0.4")
+
+
+@router.post("/logout")
 async def logout(
         user_id: str = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        token: str = Depends(get_bearer_token),
+        db: AsyncSession = Depends(get_db)
 ):
     await TokenManager.revoke_tokens(db, user_id)
+    await AccessTokens.revoke(db, token)
     return JSONResponse({"message": "Logged out successfully"})
 
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+
+    # CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["Server-Timing", "X-LLM-Calls", "X-LLM-Tokens", "ETag"],
+    )
+    app.middleware("http")(add_timing_headers)
+    app.include_router(router)
+
+    return app
+
+
+# Building the app has no side effects, the database and API clients are set up by the lifespan or on first use
+app = create_app()
+
 # Run the application
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,148 @@
+import { PUBLIC_BACKEND_URL } from "$env/static/public";
+import { error } from "@sveltejs/kit";
+import { writable, type Readable } from "svelte/store";
+import { loadingStore } from "$lib/stores/loadingStore";
+import type { DailyContent } from "$lib/types/DailyContent.types";
+
+const day_day_map_v2 = {
+    'day_1': 1,
+    'day_2': 2,
+    'day_3': 3,
+    'day_4': 4,
+    'day_5': 5,
+    'day_6': 6,
+    'day_7': 7,
+}
+
+type DayContentKind = 'flashcards' | 'quiz';
+
+const contentKey = (courseid: string, day: string) => `${courseid}-content-${day}`;
+const etagKey = (courseid: string, day: string) => `${courseid}-etag-${day}`;
+
+const request = (courseid: string, day: string, headers: Record<string, string> = {}): RequestInit => ({
+    method: 'POST',
+    headers: {
+        'Content-Type': 'application/json',
+        Authorization: `Bearer ${localStorage.getItem('cogito-token')}`,
+        ...headers,
+    },
+    body: JSON.stringify({
+        course_id: courseid,
+        day_number: Object(day_day_map_v2)[day]
+    }),
+});
+
+// Cached content is revalidated with its ETag, the backend answers 304 while it is unchanged
+const revalidate = async (fetch: typeof globalThis.fetch, courseid: string, day: string, cache: string): Promise<DailyContent> => {
+    const etag = localStorage.getItem(etagKey(courseid, day));
+    const response = await fetch(`${PUBLIC_BACKEND_URL}/generate-day-content`,
+        request(courseid, day, etag ? { 'If-None-Match': etag } : {}));
+
+    if (response.status === 304 || !response.ok) {
+        return JSON.parse(cache) as DailyContent;
+    }
+
+    const data = await response.json();
+    localStorage.setItem(contentKey(courseid, day), JSON.stringify(data));
+    const newEtag = response.headers.get('ETag');
+    if (newEtag) {
+        localStorage.setItem(etagKey(courseid, day), newEtag);
+    }
+    return data as DailyContent;
+}
+
+const parseEvent = (message: string) => {
+    let event = 'message';
+    let data = '';
+    for (const line of message.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        if (line.startsWith('data:')) data += line.slice(5).trim();
+    }
+    return { event, data: data ? JSON.parse(data) : null };
+}
+
+// Resolves as soon as the first item of kind has streamed in, the store keeps filling up after that
+const stream = async (fetch: typeof globalThis.fetch, courseid: string, day: string, kind: DayContentKind): Promise<Readable<DailyContent>> => {
+    const response = await fetch(`${PUBLIC_BACKEND_URL}/stream-day-content`, request(courseid, day));
+    if (!response.ok || !response.body) {
+        error(response.status, 'Could not load the day content');
+    }
+
+    const content = writable<DailyContent>({
+        flashcards: { topic: '', flashcard_pairs: [] },
+        quiz: { topic: '', difficulty: '', quiz_questions: [] },
+    });
+
+    return new Promise((resolve, reject) => {
+        let ready = false;
+        const markReady = () => {
+            if (!ready) {
+                ready = true;
+                resolve(content);
+            }
+        }
+
+        const handle = ({ event, data }: { event: string, data: any }) => {
+            if (event === 'flashcard') {
+                // The topic is only known once the deck is done, the card's subtopic stands in until then
+                content.update(c => ({ ...c, flashcards: {
+                    ...c.flashcards,
+                    topic: c.flashcards.topic || data.subtopic,
+                    flashcard_pairs: [...c.flashcards.flashcard_pairs, data],
+                } }));
+                if (kind === 'flashcards') markReady();
+            } else if (event === 'quiz_question') {
+                content.update(c => ({ ...c, quiz: {
+                    ...c.quiz,
+                    topic: c.quiz.topic || data.subtopic,
+                    quiz_questions: [...c.quiz.quiz_questions, data],
+                } }));
+                if (kind === 'quiz') markReady();
+            } else if (event === 'done') {
+                content.set(data as DailyContent);
+                localStorage.setItem(contentKey(courseid, day), JSON.stringify(data));
+                localStorage.removeItem(etagKey(courseid, day));
+                markReady();
+            } else if (event === 'error') {
+                throw new Error(data?.detail ?? 'Could not load the day content');
+            }
+        }
+
+        (async () => {
+            const reader = response.body!.pipeThrough(new TextDecoderStream()).getReader();
+            let buffer = '';
+            for (;;) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += value;
+
+                let end;
+                while ((end = buffer.indexOf('\n\n')) >= 0) {
+                    handle(parseEvent(buffer.slice(0, end)));
+                    buffer = buffer.slice(end + 2);
+                }
+            }
+            if (!ready) throw new Error('The day content stream ended early');
+        })().catch(e => {
+            if (ready) {
+                console.error(e);
+            } else {
+                reject(e);
+            }
+        });
+    });
+}
+
+export const loadDayContent = async (fetch: typeof globalThis.fetch, courseid: string, day: string, kind: DayContentKind): Promise<Readable<DailyContent>> => {
+    const cache = localStorage.getItem(contentKey(courseid, day));
+    if (cache) {
+        return writable(await revalidate(fetch, courseid, day, cache));
+    }
+
+    loadingStore.set(true)
+    try {
+        return await stream(fetch, courseid, day, kind);
+    } finally {
+        loadingStore.set(false)
+    }
+}